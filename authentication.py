@@ -1,4 +1,8 @@
-from rest_framework.authentication import BaseAuthentication
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from profiles.tokens import ACCESS, InvalidToken, get_token_user, parse_token
 
 
 class SessionAuthenticationNoCSRF(BaseAuthentication):
@@ -11,6 +15,9 @@ class SessionAuthenticationNoCSRF(BaseAuthentication):
         """
         Returns a `User` if the request session currently has a logged in user.
         Otherwise returns `None`.
+
+        The user is resolved from the cache, see
+        profiles.middleware.CachedAuthenticationMiddleware
         """
         # Get the underlying HttpRequest object
         request = request._request
@@ -27,3 +34,32 @@ class SessionAuthenticationNoCSRF(BaseAuthentication):
         Disable CSRF check!
         """
         pass
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Stateless token authentication, see profiles.tokens.
+    Clients authenticate with the "Authorization: Token <access token>" header.
+
+    The user is built from the token, without any database or cache access.
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+
+        if not auth or auth[0] != self.keyword.encode('ascii'):
+            return None
+
+        if len(auth) != 2:
+            raise AuthenticationFailed(_('Invalid token header.'))
+
+        try:
+            claims = parse_token(auth[1], ACCESS)
+        except InvalidToken:
+            raise AuthenticationFailed(_('Invalid or expired token.'))
+
+        return (get_token_user(claims), auth[1])
+
+    def authenticate_header(self, request):
+        return self.keyword
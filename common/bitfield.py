@@ -0,0 +1,132 @@
+"""
+Boolean fields packed into one integer column.
+
+BitField is kept in sync with boolean fields of the model: it's computed
+from them on save (pre_save, bulk_create included), so the boolean
+attributes - and the serializers built on them - work as before, while
+flag filters run on a single column:
+
+    MedicalProfile.objects.all_of('smoker', 'vegetarian')
+    -> WHERE ("profiles_medicalprofile"."flags" & 20480) = 20480
+
+BitFieldQuerySet.update() sets the bits of the flags it updates to True or
+False, raw SQL writes have to update the packed column themselves.
+
+This is a transitional step: the rows store both the boolean columns and
+the packed one, so they are a little bigger, not smaller. Dropping the
+boolean columns (serving them as properties over the packed column) is a
+separate migration, once nothing writes or reads them directly anymore.
+"""
+
+from django.db import connections, models
+from django.db.models import F
+from django.db.models.query import QuerySet
+
+
+class BitField(models.IntegerField):
+    """
+    The bits of `flags` (names of boolean fields, in bit order). Append new
+    flags at the end, the bit of a flag must never change.
+    """
+    MAX_FLAGS = 31  # signed INT
+
+    def __init__(self, flags=(), *args, **kwargs):
+        assert len(flags) <= self.MAX_FLAGS, 'BitField supports up to 31 flags'
+
+        self.flags = tuple(flags)
+        kwargs.setdefault('default', 0)
+        kwargs.setdefault('editable', False)
+        super(BitField, self).__init__(*args, **kwargs)
+
+    def get_mask(self, flags):
+        mask = 0
+        for flag in flags:
+            try:
+                mask |= 1 << self.flags.index(flag)
+            except ValueError:
+                raise ValueError('Unknown flag {!r} of {}'.format(flag, self.name))
+        return mask
+
+    def pack(self, obj):
+        """The value of the flags of `obj`"""
+        return self.get_mask(flag for flag in self.flags if getattr(obj, flag))
+
+    def unpack(self, value):
+        """The names of the flags set in `value`"""
+        return set(flag for i, flag in enumerate(self.flags) if value & (1 << i))
+
+    def pre_save(self, model_instance, add):
+        value = self.pack(model_instance)
+        setattr(model_instance, self.attname, value)
+        return value
+
+    def south_field_triple(self):
+        """Frozen as a plain IntegerField by South"""
+        from south.modelsinspector import introspector
+        args, kwargs = introspector(self)
+        return ('django.db.models.fields.IntegerField', args, kwargs)
+
+
+def get_bitfield(model):
+    for field in model._meta.concrete_fields:
+        if isinstance(field, BitField):
+            return field
+    raise ValueError('{} has no BitField'.format(model.__name__))
+
+
+class BitFieldQuerySet(QuerySet):
+    def _flag_filter(self, condition, flags):
+        field = get_bitfield(self.model)
+        mask = field.get_mask(flags)
+
+        qn = connections[self.db].ops.quote_name
+        column = '{}.{}'.format(qn(self.model._meta.db_table), qn(field.column))
+
+        return self.extra(where=[condition.format(column=column, mask=mask)])
+
+    def update(self, **kwargs):
+        """Updates the BitField too, when flags are updated"""
+        field = get_bitfield(self.model)
+        flags = [name for name in kwargs if name in field.flags]
+
+        if flags and field.attname not in kwargs:
+            if not all(kwargs[flag] in (True, False) for flag in flags):
+                raise ValueError('Flags can only be updated to True or False')
+
+            value = F(field.attname)
+            clear_mask = field.get_mask(flag for flag in flags if not kwargs[flag])
+            if clear_mask:
+                value = value.bitand(~clear_mask)
+            set_mask = field.get_mask(flag for flag in flags if kwargs[flag])
+            if set_mask:
+                value = value.bitor(set_mask)
+
+            kwargs[field.attname] = value
+
+        return super(BitFieldQuerySet, self).update(**kwargs)
+
+    def all_of(self, *flags):
+        """Rows with all the `flags` set"""
+        return self._flag_filter('({column} & {mask}) = {mask}', flags)
+
+    def any_of(self, *flags):
+        """Rows with at least one of the `flags` set"""
+        return self._flag_filter('({column} & {mask}) != 0', flags)
+
+    def none_of(self, *flags):
+        """Rows with none of the `flags` set"""
+        return self._flag_filter('({column} & {mask}) = 0', flags)
+
+
+class BitFieldManager(models.Manager):
+    def get_queryset(self):
+        return BitFieldQuerySet(self.model, using=self._db)
+
+    def all_of(self, *flags):
+        return self.get_queryset().all_of(*flags)
+
+    def any_of(self, *flags):
+        return self.get_queryset().any_of(*flags)
+
+    def none_of(self, *flags):
+        return self.get_queryset().none_of(*flags)
@@ -7,6 +7,8 @@ from django.utils.translation import ugettext_lazy as _
 from easy_thumbnails.alias import aliases
 from rest_framework import serializers
 
+from .thumbnails import get_manifests, update_manifest
+
 
 logger = logging.getLogger('vita_auth.common.fields')
 
@@ -34,6 +36,11 @@ class ImageURLField(Base64ImageField):
 
 
 class CroppedImageURLField(ImageURLField):
+    """
+    The URL of an image thumbnail, read from the image's thumbnail manifest
+    (common.thumbnails). Manifests preloaded into context['thumbnail_manifests']
+    (see ThumbnailManifestMixin) are used as-is.
+    """
     def __init__(self, *args, **kwargs):
         self.thumbnail_alias = kwargs.pop('thumbnail_alias')
         self.force_generate = kwargs.pop('force_generate', False)
@@ -41,14 +48,30 @@ class CroppedImageURLField(ImageURLField):
         kwargs['read_only'] = True
         super(CroppedImageURLField, self).__init__(*args, **kwargs)
 
+    def get_manifest(self, value):
+        context = getattr(self, 'context', None)
+        manifests = context.setdefault('thumbnail_manifests', {}) if context is not None else {}
+
+        manifest = manifests.get(value.name)
+        if manifest is None:
+            manifest = get_manifests([value.name]).get(value.name)
+            if manifest is None:
+                manifest = update_manifest(value)
+            manifests[value.name] = manifest
+
+        return manifest
+
     def to_native(self, value):
         if value:
             try:
-                thumb = value.get_thumbnail(aliases.get(self.thumbnail_alias),
-                                            generate=self.force_generate)
+                url = self.get_manifest(value).get(self.thumbnail_alias)
+
+                if url is None and self.force_generate:
+                    thumb = value.get_thumbnail(aliases.get(self.thumbnail_alias))
+                    update_manifest(value)
+                    url = thumb.url if thumb else None
 
-                url = thumb.url if thumb else value.url
-                return self.get_absoulute_url(url)
+                return self.get_absoulute_url(url or value.url)
             except Exception:  # pragma: nocover
                 logger.exception('Error getting image thumbnail')
 
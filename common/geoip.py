@@ -0,0 +1,231 @@
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+import pygeoip
+import pytz
+from django.conf import settings
+from pygeoip import const
+
+logger = logging.getLogger('vita_auth.common.geoip')
+
+_MISSING = object()
+
+
+class LRUCache(object):
+    """
+    Bounded, thread-safe mapping that evicts the least recently used key.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.pop(key, _MISSING)
+            if value is _MISSING:
+                return default
+            self._data[key] = value  # move to the end (most recently used)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            if len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class GeoIPResolver(object):
+    """
+    Process-wide ip -> country code resolver.
+
+    * The database is opened once, memory-mapped (read only), so the pages
+      are shared by all the worker processes through the OS page cache,
+      and when opened before forking (see preload()) the mapping itself
+      is inherited copy-on-write.
+    * Lookups go through a bounded LRU cache.
+    * Every `check_interval` seconds the database file's mtime is checked,
+      an updated GeoIP.dat is opened and swapped in without a restart.
+    """
+
+    def __init__(self, path=None, cache_size=None, check_interval=None):
+        self.path = path or settings.GEOIP_PATH
+        self.cache_size = cache_size or getattr(settings, 'GEOIP_CACHE_SIZE', 10000)
+        self.check_interval = (check_interval if check_interval is not None
+                               else getattr(settings, 'GEOIP_CHECK_INTERVAL', 60))
+
+        self._state = None  # (geoip, cache, mtime) - swapped as a whole
+        self._last_check = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        mtime = os.path.getmtime(self.path)
+        # cache=False - skip pygeoip's per-filename singleton so reloads
+        # get a fresh instance
+        geoip = pygeoip.GeoIP(self.path, flags=pygeoip.MMAP_CACHE, cache=False)
+        return geoip, LRUCache(self.cache_size), mtime
+
+    def preload(self):
+        """Open the database now (e.g. in the master process, before forking)"""
+        self._get_state()
+
+    def reload(self):
+        """Re-open the database file and swap it in"""
+        with self._lock:
+            self._state = self._open()
+            self._last_check = time.time()
+        logger.info('GeoIP database loaded from %s', self.path)
+
+    def _get_state(self):
+        state = self._state
+
+        if state is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._open()
+                    self._last_check = time.time()
+                return self._state
+
+        if time.time() - self._last_check >= self.check_interval:
+            self._last_check = time.time()
+            try:
+                changed = os.path.getmtime(self.path) != state[2]
+            except OSError:
+                changed = False  # Keep using the current one while the file is replaced
+
+            if changed:
+                try:
+                    self.reload()
+                except Exception:
+                    logger.exception('Error reloading GeoIP database')
+
+            return self._state
+
+        return state
+
+    def country_code_by_addr(self, ip):
+        """
+        Returns the 2-letter country code of `ip`, '' if unknown and None
+        if it can't be looked up.
+        """
+        geoip, cache, mtime = self._get_state()
+
+        country = cache.get(ip, _MISSING)
+        if country is not _MISSING:
+            return country
+
+        try:
+            country = geoip.country_code_by_addr(ip)
+        except (socket.error, pygeoip.GeoIPError, ValueError):
+            logger.debug('Unable to look up country for %r', ip)
+            country = None
+
+        cache.set(ip, country)
+        return country
+
+
+class IPRangeIndex(object):
+    """
+    Sorted table of IPv4 ranges -> country, built by walking the binary
+    tree of a GeoIP country database.
+
+    Meant for resolving many addresses at once: sort them and resolve
+    them in a single forward pass with lookup_sorted().
+    """
+
+    def __init__(self, starts, countries):
+        self.starts = starts  # first address of every range, ascending
+        self.countries = countries  # index into pygeoip's COUNTRY_CODES
+
+    @classmethod
+    def from_file(cls, path=None):
+        path = path or settings.GEOIP_PATH
+
+        geoip = pygeoip.GeoIP(path, cache=False)
+        if geoip._databaseType != const.COUNTRY_EDITION:
+            raise ValueError('Only GeoIP country (IPv4) databases are supported')
+
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+
+        segments = geoip._databaseSegments
+        leaves = []
+        stack = [(0, 0, 31)]  # node offset, first address, bit
+
+        while stack:
+            offset, ip, bit = stack.pop()
+            pos = offset * 6  # two records, 3 bytes each
+
+            for side in (0, 1):
+                record = data[pos] | (data[pos + 1] << 8) | (data[pos + 2] << 16)
+                start = ip | (side << bit)
+                pos += 3
+
+                if record >= segments:
+                    leaves.append((start, record - segments))
+                else:
+                    stack.append((record, start, bit - 1))
+
+        leaves.sort()
+
+        starts, countries = array('L'), array('H')
+        for start, country in leaves:
+            if not countries or countries[-1] != country:  # merge adjacent ranges
+                starts.append(start)
+                countries.append(country)
+
+        return cls(starts, countries)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup_sorted(self, ipnums):
+        """
+        Returns the country codes of the (ascending) integer addresses.
+        """
+        starts, countries = self.starts, self.countries
+        result = []
+        pos = 0
+
+        for ipnum in ipnums:
+            pos = bisect_right(starts, ipnum, pos) - 1  # only moves forward
+            result.append(const.COUNTRY_CODES[countries[pos]])
+
+        return result
+
+
+def ip_to_int(ip):
+    """Returns the IPv4 address as an integer, None if invalid"""
+    try:
+        return struct.unpack('!I', socket.inet_aton(ip))[0]
+    except (socket.error, TypeError):
+        return None
+
+
+_country_timezones = None
+
+
+def country_timezone(country):
+    """Returns the main timezone name of a country code, or None"""
+    global _country_timezones
+
+    if _country_timezones is None:
+        _country_timezones = dict((code, zones[0]) for code, zones
+                                  in pytz.country_timezones.items() if zones)
+
+    return _country_timezones.get(country)
+
+
+geoip_resolver = GeoIPResolver()
@@ -0,0 +1,92 @@
+"""
+Password hashing with a configurable cost.
+
+TunablePBKDF2PasswordHasher reads its iteration count from
+PASSWORD_HASHER_ITERATIONS (see the calibrate_hashers command). Passwords
+hashed with another cost are rehashed after a successful login, in a
+background thread so the login doesn't pay for a second hash.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, make_password
+from django.db import connection
+from django.dispatch import Signal
+
+from .stats import Counters
+
+logger = logging.getLogger('vita_auth.common.hashers')
+
+stats = Counters('checks', 'check_ms', 'max_check_ms', 'rehashes', 'rehash_errors')
+
+# Sent after a password was rehashed - with QuerySet.update(), no post_save
+password_rehashed = Signal(providing_args=['pk'])
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 + HMAC + SHA256 with PASSWORD_HASHER_ITERATIONS iterations.
+
+    Same algorithm name as the stock hasher, so it verifies the existing
+    hashes, and must_update() is true for the ones with another iteration count.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASHER_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+
+def rehash_password(model, pk, raw_password, encoded):
+    """
+    Store a new hash of `raw_password` for the `model` row `pk`, unless its
+    password changed since it was read as `encoded`.
+    """
+    try:
+        updated = model._default_manager.filter(pk=pk, password=encoded).update(
+            password=make_password(raw_password))
+        stats.incr('rehashes', updated)
+    except Exception:
+        logger.exception('Rehashing the password of %s %s failed', model.__name__, pk)
+        stats.incr('rehash_errors')
+        return
+
+    if updated:
+        password_rehashed.send(sender=model, pk=pk)
+
+
+def _rehash_in_thread(*args):
+    try:
+        rehash_password(*args)
+    finally:
+        connection.close()  # the thread's own connection
+
+
+def check_and_rehash(user, raw_password):
+    """
+    check_password() for user models, rehashing outdated hashes after a
+    successful check (in a thread, unless PASSWORD_REHASH_ASYNC is False).
+    Records the time spent hashing.
+    """
+    def setter(raw_password):
+        args = (user.__class__, user.pk, raw_password, user.password)
+
+        if getattr(settings, 'PASSWORD_REHASH_ASYNC', True):
+            thread = threading.Thread(target=_rehash_in_thread, args=args)
+            thread.daemon = True
+            thread.start()
+        else:
+            rehash_password(*args)
+
+    start = time.time()
+    result = check_password(raw_password, user.password, setter)
+    elapsed = int((time.time() - start) * 1000)
+
+    stats.incr('checks')
+    stats.incr('check_ms', elapsed)
+    if elapsed > stats.get('max_check_ms'):
+        stats.set('max_check_ms', elapsed)
+
+    return result
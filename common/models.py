@@ -1 +1,89 @@
-import signals  # noqa
+from django.db.models import FileField
+from model_utils.fields import AutoLastModifiedField
+
+from .bitfield import BitField
+
+
+class DirtyFieldsMixin(object):
+    """
+    Tracks which fields changed since the instance was loaded (or last saved).
+
+    save() of an existing instance writes only the changed fields, plus the
+    fields updated on every save (auto_now, `modified`), unless update_fields
+    is given. When nothing changed it doesn't query at all, and no signals
+    are sent. The BitFields of the written flags are always written too.
+
+    Deferred fields aren't tracked, once loaded they count as changed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(DirtyFieldsMixin, self).__init__(*args, **kwargs)
+        self._reset_state()
+
+    def _reset_state(self, fields=None):
+        """Mark `fields` (names or attnames, all of them by default) as saved"""
+        values = self._get_field_values()
+
+        if fields is None:
+            self._original_state = values
+            return
+
+        fields = set(fields)
+        for field in self._meta.concrete_fields:
+            if (field.name in fields or field.attname in fields) and field.attname in values:
+                self._original_state[field.attname] = values[field.attname]
+
+    def _get_field_values(self):
+        values = {}
+
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                continue  # deferred
+
+            value = self.__dict__[field.attname]
+            if isinstance(field, FileField):
+                value = getattr(value, 'name', value) or None
+
+            values[field.attname] = value
+
+        return values
+
+    def get_dirty_fields(self):
+        """The attribute names of the fields that changed since load"""
+        original = self._original_state
+
+        return set(attname for attname, value in self._get_field_values().iteritems()
+                   if attname not in original or original[attname] != value)
+
+    def has_changed(self, field_name):
+        attname = self._meta.get_field(field_name).attname
+        return attname in self.get_dirty_fields()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and self.pk is not None and not args and
+                not kwargs.get('force_insert') and kwargs.get('update_fields') is None):
+            update_fields = self.get_dirty_fields()
+            update_fields.discard(self._meta.pk.attname)
+
+            if update_fields:
+                update_fields.update(
+                    field.attname for field in self._meta.concrete_fields
+                    if getattr(field, 'auto_now', False) or
+                    isinstance(field, AutoLastModifiedField))
+
+            kwargs['update_fields'] = update_fields
+
+        if kwargs.get('update_fields'):
+            update_fields = set(kwargs['update_fields'])
+            bitfields = set(field.attname for field in self._meta.concrete_fields
+                            if isinstance(field, BitField) and
+                            not update_fields.isdisjoint(field.flags))
+
+            if not bitfields <= update_fields:
+                kwargs['update_fields'] = update_fields | bitfields
+
+        super(DirtyFieldsMixin, self).save(*args, **kwargs)
+
+        # After a partial save the other changes are still unsaved
+        update_fields = kwargs.get('update_fields', args[3] if len(args) > 3 else None)
+        self._reset_state(update_fields)
@@ -0,0 +1,106 @@
+"""
+Keyset (cursor) pagination for list views.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import ParseError
+from rest_framework.templatetags.rest_framework import replace_query_param
+
+
+class CursorPaginationMixin(object):
+    """
+    Paginates list() by the `cursor_ordering` fields instead of OFFSET, so any
+    page costs as much as the first one, and doesn't COUNT(*) the table.
+
+    The last of `cursor_ordering` must be unique (e.g. "id"), the ordering
+    should be covered by an index. It overrides the `ordering` query parameter.
+
+    The response body is still the list of objects. The next page URL is
+    in the `Link: <url>; rel="next"` header, with an opaque `cursor`
+    parameter. The page size can be set with `page_size`, up to
+    CURSOR_MAX_PAGE_SIZE.
+    """
+    cursor_ordering = ('id', )
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self):
+        page_size = getattr(settings, 'CURSOR_PAGE_SIZE', 100)
+        max_page_size = getattr(settings, 'CURSOR_MAX_PAGE_SIZE', 1000)
+
+        try:
+            page_size = int(self.request.QUERY_PARAMS[self.page_size_query_param])
+        except (KeyError, ValueError):
+            pass
+
+        return max(1, min(page_size, max_page_size))
+
+    def encode_cursor(self, obj):
+        values = [self.model._meta.get_field(name).value_to_string(obj)
+                  for name in self.cursor_ordering]
+        return urlsafe_b64encode(json.dumps(values)).rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4)))
+            if len(values) != len(self.cursor_ordering):
+                raise ValueError
+
+            return [self.model._meta.get_field(name).to_python(value)
+                    for name, value in zip(self.cursor_ordering, values)]
+        except (TypeError, ValueError, UnicodeEncodeError, ValidationError):
+            raise ParseError(_('Invalid cursor.'))
+
+    def get_cursor_filter(self, values):
+        """
+        Rows after `values` in the cursor ordering:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        q = Q()
+        for i, name in enumerate(self.cursor_ordering):
+            condition = dict(zip(self.cursor_ordering[:i], values[:i]))
+            condition[name + '__gt'] = values[i]
+            q |= Q(**condition)
+        return q
+
+    def paginate_queryset(self, queryset, page_size=None):
+        """
+        Replaces self.object_list with the current page. Returns None, so
+        list() serializes it as a plain list.
+        """
+        self.next_cursor = None
+
+        if not hasattr(queryset, 'order_by'):
+            return None  # e.g. an empty list for anonymous users
+
+        page_size = page_size or self.get_page_size()
+        queryset = queryset.order_by(*self.cursor_ordering)
+
+        cursor = self.request.QUERY_PARAMS.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.get_cursor_filter(self.decode_cursor(cursor)))
+
+        # One extra row tells if there's a next page
+        page = list(queryset[:page_size + 1])
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = self.encode_cursor(page[-1])
+
+        self.object_list = page
+        return None
+
+    def list(self, request, *args, **kwargs):
+        response = super(CursorPaginationMixin, self).list(request, *args, **kwargs)
+
+        if self.next_cursor:
+            url = replace_query_param(request.build_absolute_uri(),
+                                      self.cursor_query_param, self.next_cursor)
+            response['Link'] = '<{}>; rel="next"'.format(url)
+
+        return response
@@ -0,0 +1,26 @@
+try:
+    import msgpack
+except ImportError:  # pragma: nocover
+    msgpack = None
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack-serialized data.
+    """
+
+    media_type = 'application/x-msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Parses the incoming bytestream as MessagePack and returns the resulting data.
+        """
+        assert msgpack, 'MessagePackParser requires msgpack-python to be installed'
+
+        try:
+            return msgpack.unpackb(stream.read(), encoding='utf-8')
+        except Exception as exc:
+            raise ParseError('MessagePack parse error - %s' % exc)
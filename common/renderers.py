@@ -0,0 +1,32 @@
+try:
+    import msgpack
+except ImportError:  # pragma: nocover
+    msgpack = None
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renderer which serializes to MessagePack.
+
+    Dates, times, decimals etc. are converted like in the JSON output
+    (rest_framework's JSONEncoder), e.g. datetimes are ISO 8601 strings.
+    """
+
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Renders `data` into serialized MessagePack.
+        """
+        assert msgpack, 'MessagePackRenderer requires msgpack-python to be installed'
+
+        if data is None:
+            return b''
+
+        return msgpack.packb(data, default=JSONEncoder().default)
@@ -1,5 +1,175 @@
+from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
-from rest_framework import serializers
+from rest_framework import fields as rest_fields, serializers
+
+from .geoip import LRUCache
+
+FIELDS_QUERY_PARAM = 'fields'
+EXCLUDE_QUERY_PARAM = 'exclude'
+
+
+def parse_field_names(value):
+    """
+    'id,profiles.name,profiles.age' -> {'id': {}, 'profiles': {'name': {}, 'age': {}}}
+    """
+    tree = {}
+    for name in (value or '').split(','):
+        node = tree
+        for part in name.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def get_sparse_fields(request):
+    """
+    The (fields, exclude) trees requested in the query string, only GET
+    requests are sparse.
+    """
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return {}, {}
+
+    params = getattr(request, 'QUERY_PARAMS', request.GET)  # also plain HttpRequests
+    return (parse_field_names(params.get(FIELDS_QUERY_PARAM)),
+            parse_field_names(params.get(EXCLUDE_QUERY_PARAM)))
+
+
+def prune_fields(fields, requested, excluded):
+    """Drop the unrequested / excluded fields (in place), also of nested serializers"""
+    for name in list(fields):
+        if (requested and name not in requested) or excluded.get(name) == {}:
+            del fields[name]
+            continue
+
+        nested = getattr(fields[name], 'fields', None)
+        if nested is not None and (requested.get(name) or excluded.get(name)):
+            prune_fields(nested, requested.get(name, {}), excluded.get(name, {}))
+
+    return fields
+
+
+class SparseFieldsMixin(object):
+    """
+    Select the serialized fields with the `fields` / `exclude` query
+    parameters (comma separated, dotted for nested serializers), e.g.
+    ?fields=id,account_name or ?exclude=profiles.medicines_text
+
+    The fields are dropped when the serializer is created, so they're never
+    computed. Only the serializer created with the request in its context
+    (the view's) is pruned, and only for GET requests.
+    """
+
+    def get_fields(self):
+        fields = super(SparseFieldsMixin, self).get_fields()
+
+        requested, excluded = get_sparse_fields(self.context.get('request'))
+        if requested or excluded:
+            prune_fields(fields, requested, excluded)
+
+        return fields
+
+
+# field_to_native() implementations that only read `source` and call to_native()
+_PLAIN_FIELD_TO_NATIVE = (rest_fields.Field.field_to_native.__func__,
+                          rest_fields.WritableField.field_to_native.__func__)
+
+
+class CompiledDict(serializers.SortedDictWithMetadata):
+    """
+    Serialized object of a compiled serializer. The field metadata, used only
+    by the browsable API's HTML forms, is built on access.
+    """
+    def __init__(self, serializer):
+        super(CompiledDict, self).__init__()
+        self._serializer = serializer
+
+    @cached_property
+    def fields(self):
+        return self._serializer.get_fields_metadata(self)
+
+
+class CompiledSerializerMixin(object):
+    """
+    Fast to_native() for serializers with `compiled = True` in their Meta.
+
+    A plan - the key, the source attribute and a transform_<field> method per
+    field - is built once per serializer class and field set, and objects are
+    serialized in a tight loop over it. Fields with a custom field_to_native()
+    (nested serializers, method fields, related fields, ModelField) are still
+    called as usual. The output is the same as the regular to_native().
+
+    The field sets come from the query string (?fields=), so only the
+    `max_compiled_plans` most recently used plans are kept.
+    """
+    _compiled_plans = None
+    max_compiled_plans = 32
+
+    def get_plan(self):
+        cls = self.__class__
+        if cls.__dict__.get('_compiled_plans') is None:
+            cls._compiled_plans = LRUCache(self.max_compiled_plans)
+
+        signature = tuple((name, type(field), field.source, getattr(field, 'write_only', False))
+                          for name, field in self.fields.items())
+        plan = cls._compiled_plans.get(signature)
+
+        if plan is None:
+            plan = []
+            for field_name, field in self.fields.items():
+                source = field.source or field_name
+                plain = (getattr(type(field).field_to_native, '__func__', None) in
+                         _PLAIN_FIELD_TO_NATIVE and source != '*' and '.' not in source)
+                transform = 'transform_%s' % field_name
+
+                plan.append((field_name, self.get_field_key(field_name),
+                             source if plain else None,
+                             transform if callable(getattr(self, transform, None)) else None,
+                             getattr(field, 'write_only', False)))
+
+            plan = tuple(plan)
+            cls._compiled_plans.set(signature, plan)
+
+        return plan
+
+    def to_native(self, obj):
+        if obj is None or not getattr(self.Meta, 'compiled', False):
+            return super(CompiledSerializerMixin, self).to_native(obj)
+
+        fields = self.fields
+        plan = self.__dict__.get('_plan')
+
+        # Built on first use, and again if fields were removed since (e.g. in restore_object())
+        if plan is None or len(plan) != len(fields):
+            plan = self._plan = self.get_plan()
+            for field_name, field in fields.items():
+                field.initialize(parent=self, field_name=field_name)
+
+        get_component = rest_fields.get_component
+        ret = CompiledDict(self)
+
+        for field_name, key, source, transform, write_only in plan:
+            if write_only:
+                continue
+
+            field = fields[field_name]
+            if source is not None:
+                value = field.to_native(get_component(obj, source))
+            else:
+                value = field.field_to_native(obj, field_name)
+
+            if transform is not None:
+                value = getattr(self, transform)(obj, value)
+
+            ret[key] = value
+
+        return ret
+
+    def get_fields_metadata(self, data):
+        metadata = self._dict_class()
+        for field_name, field in self.fields.items():
+            key = self.get_field_key(field_name)
+            metadata[key] = self.augment_field(field, field_name, key, data.get(key))
+        return metadata
 
 
 class PartialModelSerializer(serializers.ModelSerializer):
@@ -65,10 +235,13 @@ class CustomSerializer(FormatErrorsSerializer):
     """
 
 
-class CustomModelSerializer(FormatErrorsSerializer, PartialModelSerializer):
+class CustomModelSerializer(SparseFieldsMixin, CompiledSerializerMixin, FormatErrorsSerializer,
+                            PartialModelSerializer):
     """
     ModelSerializer class to be used accross the Vita API.
 
     Allows partial updates (PartialModelSerializer)
     Displays pretty error messages (FormatErrorsModelSerializer)
+    Supports ?fields= / ?exclude= (SparseFieldsMixin)
+    Serializes faster with `compiled = True` in Meta (CompiledSerializerMixin)
     """
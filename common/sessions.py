@@ -0,0 +1,326 @@
+"""
+Cached, database-backed sessions that are written only when needed, and a
+compact session serializer.
+"""
+
+import base64
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: nocover
+    import pickle
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import get_cache
+from django.core.exceptions import ImproperlyConfigured, SuspiciousOperation
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from django.utils.encoding import force_bytes, force_text
+from django.utils.functional import Promise
+
+from common.stats import Counters
+from common.utils import is_shared_cache
+
+logger = logging.getLogger('vita_auth.common.sessions')
+
+KEY_PREFIX = 'common.sessions'
+
+stats = Counters('cache_hits', 'cache_misses', 'writes', 'touches', 'writes_avoided')
+
+
+class SessionStore(DBStore):
+    """
+    Database backed sessions, read through a cache.
+
+    save() (called on every request with SESSION_SAVE_EVERY_REQUEST) only
+    writes to the database if the session data changed, or if the remaining
+    lifetime of the stored session fell below SESSION_TOUCH_FRACTION of its
+    age ("lazy touch").
+
+    The cache (SESSION_CACHE_ALIAS) must be shared by all the workers, a
+    session deleted by one of them would stay valid in the others' caches:
+    a per-process cache raises ImproperlyConfigured.
+    """
+
+    def __init__(self, session_key=None):
+        super(SessionStore, self).__init__(session_key)
+        self._cache = get_cache(getattr(settings, 'SESSION_CACHE_ALIAS', 'default'))
+
+        if not is_shared_cache(self._cache):
+            raise ImproperlyConfigured(
+                'common.sessions needs a cache shared by the worker processes (e.g. '
+                'memcached), use django.contrib.sessions.backends.db otherwise')
+
+        # The session as it's currently stored
+        self._stored_data = None
+        self._stored_expire_date = None
+
+    @property
+    def cache_key(self):
+        return KEY_PREFIX + self._get_or_create_session_key()
+
+    def _remember(self, session_data, expire_date):
+        self._stored_data = session_data
+        self._stored_expire_date = expire_date
+
+        self._cache.set(self.cache_key, (session_data, expire_date),
+                        self.get_expiry_age(expiry=expire_date))
+
+    def load(self):
+        try:
+            cached = self._cache.get(self.cache_key, None)
+        except Exception:
+            # Some backends (e.g. memcache) raise an exception on invalid
+            # cache keys, treat it as a miss.
+            cached = None
+
+        if cached is not None and cached[1] > timezone.now():
+            stats.incr('cache_hits')
+            self._stored_data, self._stored_expire_date = cached
+            return self.decode(cached[0])
+
+        stats.incr('cache_misses')
+
+        try:
+            s = Session.objects.get(
+                session_key=self.session_key,
+                expire_date__gt=timezone.now()
+            )
+        except (Session.DoesNotExist, SuspiciousOperation) as e:
+            if isinstance(e, SuspiciousOperation):
+                security_logger = logging.getLogger('django.security.%s' %
+                                                    e.__class__.__name__)
+                security_logger.warning(force_text(e))
+            self.create()
+            return {}
+
+        self._remember(s.session_data, s.expire_date)
+        return self.decode(s.session_data)
+
+    def exists(self, session_key):
+        if (KEY_PREFIX + session_key) in self._cache:
+            return True
+        return super(SessionStore, self).exists(session_key)
+
+    def needs_touch(self):
+        """
+        True if the stored expiry date is close enough to be extended
+        """
+        fraction = getattr(settings, 'SESSION_TOUCH_FRACTION', 0.9)
+        remaining = self._stored_expire_date - timezone.now()
+
+        return remaining < timedelta(seconds=self.get_expiry_age() * fraction)
+
+    def is_unchanged(self, session, session_data):
+        """
+        True if the session equals the stored one.
+
+        Equal sessions aren't always encoded byte-for-byte the same (pickle,
+        dict order), so they're compared decoded. Data in an old format (see
+        the serializer's is_current()) counts as changed, to be re-encoded.
+        """
+        if session_data == self._stored_data:
+            return True
+
+        is_current = getattr(self.serializer(), 'is_current', None)
+        if is_current is not None:
+            encoded = base64.b64decode(force_bytes(self._stored_data))
+            if not is_current(encoded.split(b':', 1)[-1]):  # hash:serialized
+                return False
+
+        return self.decode(self._stored_data) == session
+
+    def save(self, must_create=False):
+        session = self._get_session(no_load=must_create)
+        session_data = self.encode(session)
+
+        if not must_create and self._stored_data is not None:
+            if not self.is_unchanged(session, session_data):
+                stats.incr('writes')
+            elif self.needs_touch():
+                stats.incr('touches')
+            else:
+                stats.incr('writes_avoided')
+                return
+        else:
+            stats.incr('writes')
+
+        expire_date = self.get_expiry_date()
+        obj = Session(
+            session_key=self._get_or_create_session_key(),
+            session_data=session_data,
+            expire_date=expire_date
+        )
+        using = router.db_for_write(Session, instance=obj)
+        try:
+            with transaction.atomic(using=using):
+                obj.save(force_insert=must_create, using=using)
+        except IntegrityError:
+            if must_create:
+                raise CreateError
+            raise
+
+        self._remember(session_data, expire_date)
+
+    def delete(self, session_key=None):
+        super(SessionStore, self).delete(session_key)
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        self._cache.delete(KEY_PREFIX + session_key)
+
+        if session_key == self.session_key:
+            self._stored_data = self._stored_expire_date = None
+
+    def flush(self):
+        """
+        Removes the current session data from the database and regenerates the
+        key.
+        """
+        self.clear()
+        self.delete(self.session_key)
+        self.create()
+
+
+TYPE_KEY = '__t'
+VALUE_KEY = 'v'
+
+
+def _is_tagged(obj):
+    return len(obj) == 2 and TYPE_KEY in obj and VALUE_KEY in obj
+
+
+def _pack(value):
+    """
+    Converts a session value to JSON types, tagging the types JSON can't
+    represent. Raises TypeError for unsupported values.
+    """
+    value_type = type(value)
+
+    if value is None or value_type in (bool, int, long, float, str, unicode):
+        return value
+
+    if value_type is dict:
+        if not all(isinstance(key, basestring) for key in value):
+            raise TypeError('Only string keys are supported')
+        if _is_tagged(value):  # would be read back as a tagged value
+            return {TYPE_KEY: 'dict',
+                    VALUE_KEY: [[key, _pack(item)] for key, item in value.iteritems()]}
+        return dict((key, _pack(item)) for key, item in value.iteritems())
+
+    if value_type is list:
+        return [_pack(item) for item in value]
+
+    if value_type is tuple:
+        return {TYPE_KEY: 'tuple', VALUE_KEY: [_pack(item) for item in value]}
+
+    if value_type is set:
+        return {TYPE_KEY: 'set', VALUE_KEY: [_pack(item) for item in value]}
+
+    if value_type is datetime:
+        return {TYPE_KEY: 'datetime', VALUE_KEY: value.isoformat()}
+
+    if value_type is date:
+        return {TYPE_KEY: 'date', VALUE_KEY: value.isoformat()}
+
+    if value_type is time:
+        return {TYPE_KEY: 'time', VALUE_KEY: value.isoformat()}
+
+    if value_type is timedelta:
+        return {TYPE_KEY: 'timedelta',
+                VALUE_KEY: [value.days, value.seconds, value.microseconds]}
+
+    if value_type is Decimal:
+        return {TYPE_KEY: 'decimal', VALUE_KEY: str(value)}
+
+    if isinstance(value, Promise):
+        return force_text(value)
+
+    raise TypeError('Unsupported session value type: %s' % value_type.__name__)
+
+
+_PLAIN_TYPES = frozenset((type(None), bool, int, long, float, str, unicode))
+
+
+def _is_plain(session):
+    """True if `session` is a flat dict of JSON values, with nothing to tag"""
+    return (all(type(value) in _PLAIN_TYPES for value in session.itervalues()) and
+            not _is_tagged(session))
+
+
+_UNPACKERS = {
+    'dict': dict,  # a dict that looks like a tagged value, as [key, value] pairs
+    'tuple': tuple,
+    'set': set,
+    'datetime': parse_datetime,
+    'date': parse_date,
+    'time': parse_time,
+    'timedelta': lambda value: timedelta(*value),
+    'decimal': Decimal,
+}
+
+
+def _unpack(obj):
+    if _is_tagged(obj):
+        unpacker = _UNPACKERS.get(obj[TYPE_KEY])
+        if unpacker is not None:
+            return unpacker(obj[VALUE_KEY])
+    return obj
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+_decoder = json.JSONDecoder()
+_tagged_decoder = json.JSONDecoder(object_hook=_unpack)
+
+
+class CompactSerializer(object):
+    """
+    Session serializer: a versioned header followed by compact JSON, with
+    type tags for tuples, sets, dates/times and decimals. Flat sessions of
+    plain JSON values (the usual auth session) skip the tagging walk, and
+    data without tags is decoded without the object hook.
+
+    The key order isn't stable, SessionStore compares decoded sessions to
+    detect changes (not `deterministic`).
+
+    Data without the header was written by the PickleSerializer and is still
+    loaded, such sessions are re-encoded on their next save. Sessions holding
+    values JSON can't represent (e.g. contrib.messages objects) are pickled.
+    """
+    HEADER = b'\x011'  # magic byte + format version
+
+    def is_current(self, data):
+        """False for data written by the PickleSerializer"""
+        return data.startswith(self.HEADER)
+
+    def dumps(self, obj):
+        if type(obj) is dict and _is_plain(obj):
+            return self.HEADER + _encoder.encode(obj)
+
+        try:
+            packed = _pack(obj)
+        except TypeError:
+            logger.warning('Falling back to pickle for session data', exc_info=True)
+            return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+        return self.HEADER + _encoder.encode(packed)
+
+    def loads(self, data):
+        if data.startswith(self.HEADER):
+            data = data[len(self.HEADER):]
+            decoder = _tagged_decoder if '"%s"' % TYPE_KEY in data else _decoder
+            return decoder.raw_decode(data)[0]  # written by dumps(), no whitespace around
+
+        return pickle.loads(data)  # Stored by the PickleSerializer
+
+
+# At bottom to avoid circular import
+from django.contrib.sessions.models import Session
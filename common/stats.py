@@ -0,0 +1,33 @@
+import threading
+
+
+class Counters(object):
+    """
+    Thread-safe, process-local counters used for exposing runtime metrics
+    (cache hits, skipped writes, flushes...).
+    """
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._names = names
+        self._values = dict.fromkeys(names, 0)
+
+    def incr(self, name, delta=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + delta
+
+    def set(self, name, value):
+        with self._lock:
+            self._values[name] = value
+
+    def get(self, name):
+        return self._values.get(name, 0)
+
+    def snapshot(self):
+        """Returns a copy of the current values"""
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = dict.fromkeys(self._names, 0)
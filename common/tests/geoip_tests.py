@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase
+
+from common.geoip import GeoIPResolver, IPRangeIndex, LRUCache, ip_to_int
+
+
+class LRUCacheTestCase(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.get('a'), 1)
+        self.assertEquals(cache.get('b'), None)
+        self.assertEquals(cache.get('c'), 3)
+
+
+class GeoIPResolverTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'GeoIP.dat')
+        shutil.copy(settings.GEOIP_PATH, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lookup(self):
+        resolver = GeoIPResolver(path=self.path)
+
+        self.assertEquals(resolver.country_code_by_addr('37.26.147.250'), 'IL')
+        self.assertEquals(resolver.country_code_by_addr('37.26.147.250'), 'IL')  # cached
+        self.assertEquals(resolver.country_code_by_addr('invalid'), None)
+
+    def test_reload_on_change(self):
+        resolver = GeoIPResolver(path=self.path, check_interval=0)
+        resolver.preload()
+        geoip = resolver._state[0]
+
+        stat = os.stat(self.path)
+        os.utime(self.path, (stat.st_atime, stat.st_mtime + 10))
+
+        self.assertEquals(resolver.country_code_by_addr('37.26.147.250'), 'IL')
+        self.assertIsNot(resolver._state[0], geoip)
+
+
+class IPRangeIndexTestCase(TestCase):
+    def test_lookup_sorted_matches_resolver(self):
+        index = IPRangeIndex.from_file()
+        resolver = GeoIPResolver()
+        ips = ['8.8.8.8', '37.26.147.250', '81.2.69.160', '127.0.0.1', '200.1.1.1']
+
+        ips.sort(key=ip_to_int)
+        countries = index.lookup_sorted([ip_to_int(ip) for ip in ips])
+
+        self.assertEquals(countries, [resolver.country_code_by_addr(ip) for ip in ips])
+        self.assertIn('IL', countries)
@@ -0,0 +1,156 @@
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.sessions.models import Session
+from django.contrib.sessions.serializers import PickleSerializer
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from common.sessions import CompactSerializer, SessionStore, stats
+
+
+class SessionStoreTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+
+        session = SessionStore()
+        session['user_id'] = 1
+        session.save()
+        self.session_key = session.session_key
+
+    def test_load_from_cache(self):
+        session = SessionStore(self.session_key)
+
+        with self.assertNumQueries(0):
+            self.assertEquals(session['user_id'], 1)
+
+        self.assertEquals(stats.get('cache_hits'), 1)
+
+    def test_load_from_db_on_cache_miss(self):
+        cache.clear()
+        session = SessionStore(self.session_key)
+
+        with self.assertNumQueries(1):
+            self.assertEquals(session['user_id'], 1)
+
+        self.assertEquals(stats.get('cache_misses'), 1)
+
+    def test_unchanged_session_is_not_written(self):
+        session = SessionStore(self.session_key)
+        session.get('user_id')
+
+        with self.assertNumQueries(0):
+            session.save()
+
+        self.assertEquals(stats.get('writes_avoided'), 1)
+
+    def test_changed_session_is_written(self):
+        session = SessionStore(self.session_key)
+        session['user_id'] = 2
+        session.save()
+
+        cache.clear()
+        self.assertEquals(SessionStore(self.session_key)['user_id'], 2)
+
+    def test_lazy_touch(self):
+        session = SessionStore(self.session_key)
+        session.get('user_id')
+
+        self.assertFalse(session.needs_touch())
+
+        # Most of the session's lifetime passed
+        session._stored_expire_date = timezone.now() + timedelta(seconds=10)
+        self.assertTrue(session.needs_touch())
+
+        session.save()
+        self.assertEquals(stats.get('touches'), 1)
+        self.assertFalse(session.needs_touch())
+
+    def test_delete(self):
+        session = SessionStore(self.session_key)
+        session.delete()
+
+        self.assertFalse(session.exists(self.session_key))
+        self.assertEquals(SessionStore(self.session_key).get('user_id'), None)
+
+    @override_settings(LOCAL_CACHE_IS_SHARED=False)
+    def test_per_process_cache_is_refused(self):
+        self.assertRaises(ImproperlyConfigured, SessionStore, self.session_key)
+
+
+class CompactSerializerTestCase(TestCase):
+    def test_round_trip(self):
+        data = {
+            '_auth_user_id': 1,
+            'name': u'\u05e9\u05dc\u05d5\u05dd',
+            'when': timezone.now(),
+            'day': date(2014, 5, 1),
+            'delta': timedelta(days=1, seconds=5),
+            'price': Decimal('1.10'),
+            'pair': (1, 2),
+            'tags': set(['a', 'b']),
+            'nested': {'items': [1, None, True, 2.5]},
+        }
+        serializer = CompactSerializer()
+        serialized = serializer.dumps(data)
+
+        self.assertTrue(serialized.startswith(CompactSerializer.HEADER))
+        self.assertEquals(serializer.loads(serialized), data)
+
+    def test_plain_session(self):
+        data = {'_auth_user_id': 1, 'backend': u'b', 'flag': True, 'none': None}
+        serializer = CompactSerializer()
+        serialized = serializer.dumps(data)
+
+        self.assertEquals(json.loads(serialized[len(CompactSerializer.HEADER):]), data)
+        self.assertEquals(serializer.loads(serialized), data)
+        self.assertEquals(serializer.loads(serializer.dumps({'__t': 'date', 'v': 'x'})),
+                          {'__t': 'date', 'v': 'x'})
+
+    def test_dicts_shaped_like_tagged_values(self):
+        data = {'tagged': {'__t': 'date', 'v': '2014-05-01'},
+                'nested': {'__t': 'x', 'v': {'__t': 'set', 'v': [1]}}}
+        serializer = CompactSerializer()
+        self.assertEquals(serializer.loads(serializer.dumps(data)), data)
+
+    def test_unknown_tag_is_loaded_as_dict(self):
+        serialized = CompactSerializer.HEADER + '{"a":{"__t":"unknown","v":1}}'
+        self.assertEquals(CompactSerializer().loads(serialized),
+                          {'a': {'__t': 'unknown', 'v': 1}})
+
+    def test_loads_pickled_data(self):
+        data = {'_auth_user_id': 1}
+        self.assertEquals(CompactSerializer().loads(PickleSerializer().dumps(data)), data)
+
+    def test_unsupported_values_are_pickled(self):
+        data = {'object': Exception}
+        serialized = CompactSerializer().dumps(data)
+
+        self.assertFalse(serialized.startswith(CompactSerializer.HEADER))
+        self.assertEquals(CompactSerializer().loads(serialized), data)
+
+
+class SessionMigrationTestCase(TestCase):
+    def test_pickled_session_is_reencoded(self):
+        cache.clear()
+
+        legacy = SessionStore()
+        legacy.serializer = PickleSerializer
+        legacy['user_id'] = 1
+        legacy.save()
+        cache.clear()
+
+        session = SessionStore(legacy.session_key)
+        self.assertEquals(session['user_id'], 1)
+        session.save()
+
+        stored = Session.objects.get(session_key=legacy.session_key)
+        self.assertEquals(stored.session_data, session.encode({'user_id': 1}))
+
+        with self.assertNumQueries(0):
+            session.save()  # Already in the new format
@@ -0,0 +1,90 @@
+import json
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.client import RequestFactory
+from rest_framework.request import Request
+
+from common import throttling
+from common.throttling import (EmailRateThrottle, IPRateThrottle, SlidingWindowThrottle,
+                               local_counters, stats)
+from profiles.models import User
+
+
+class View(object):
+    throttle_scope = 'test'
+
+
+class BrokenCounters(object):
+    def get_many(self, keys):
+        raise ValueError('no cache')
+
+
+class SlidingWindowThrottleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_counters.clear()
+        stats.reset()
+
+        self.rates = SlidingWindowThrottle.THROTTLE_RATES
+        SlidingWindowThrottle.THROTTLE_RATES = {'test_ip': '2/min', 'test_email': '2/min',
+                                         'login_ip': '3/min', 'login_email': '2/min'}
+
+    def tearDown(self):
+        SlidingWindowThrottle.THROTTLE_RATES = self.rates
+
+    def allow(self, now, ip='10.0.0.1', throttle_class=IPRateThrottle, data=None):
+        throttle = throttle_class()
+        throttle.timer = lambda: now
+
+        request = RequestFactory().post('/', data or {}, REMOTE_ADDR=ip)
+        return throttle.allow_request(Request(request), View())
+
+    def test_sliding_window(self):
+        self.assertTrue(self.allow(60))
+        self.assertTrue(self.allow(90))
+        self.assertFalse(self.allow(100))
+        self.assertTrue(self.allow(100, ip='10.0.0.2'))
+
+        # 2 requests in the previous window, weighted by the overlap
+        self.assertFalse(self.allow(120))  # 2 * 60 / 60
+        self.assertTrue(self.allow(150))  # 2 * 30 / 60
+        self.assertFalse(self.allow(150))  # 1 + 2 * 30 / 60
+        self.assertTrue(self.allow(170))  # 1 + 2 * 10 / 60
+
+        self.assertEquals(stats.get('rejected'), 3)
+        self.assertEquals(stats.get('rejected.test_ip'), 3)
+
+    def test_email(self):
+        self.assertTrue(self.allow(0, throttle_class=EmailRateThrottle,
+                                   data={'email': 'Test@example.com'}))
+        self.assertTrue(self.allow(0, throttle_class=EmailRateThrottle,
+                                   data={'email': ' test@example.com'}))
+        self.assertFalse(self.allow(0, throttle_class=EmailRateThrottle,
+                                    data={'email': 'TEST@example.com'}))
+        self.assertTrue(self.allow(0, throttle_class=EmailRateThrottle))  # no email
+
+    def test_local_fallback(self):
+        counters, throttling.cache_counters = throttling.cache_counters, BrokenCounters()
+        try:
+            self.assertTrue(self.allow(0))
+            self.assertTrue(self.allow(0))
+            self.assertFalse(self.allow(0))
+        finally:
+            throttling.cache_counters = counters
+
+        self.assertEquals(stats.get('fallbacks'), 3)
+
+    def test_login_rejected_before_authentication(self):
+        User.objects.create_user(email='test@example.com')
+        data = json.dumps({'email': 'test@example.com', 'password': 'wrong'})
+
+        for i in range(2):
+            res = self.client.post('/api/login', data, content_type='application/json')
+            self.assertEquals(res.status_code, 400)
+
+        with self.assertNumQueries(0):
+            res = self.client.post('/api/login', data, content_type='application/json')
+
+        self.assertEquals(res.status_code, 429)
+        self.assertEquals(stats.get('rejected.login_email'), 1)
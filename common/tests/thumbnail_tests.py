@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from common.fields import CroppedImageURLField
+from common.thumbnails import _get_key, get_manifests, load_manifests, stats
+from profiles.models import User
+
+
+class ThumbnailManifestTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        stats.reset()
+
+        self.user = User(email='test@example.com', image='images/test.png')
+        cache.set(_get_key('images/test.png'), {'100': '/media/images/test.png.100.png'})
+
+    def get_field(self, context=None):
+        field = CroppedImageURLField(source='image', thumbnail_alias='100')
+        field.context = dict(context or {}, request=RequestFactory().get('/'))
+        return field
+
+    def test_url_from_manifest(self):
+        url = self.get_field().to_native(self.user.image)
+        self.assertEquals(url, 'http://testserver/media/images/test.png.100.png')
+        self.assertEquals(stats.get('hits'), 1)
+
+    def test_preloaded_manifests(self):
+        manifests = {'images/test.png': {'100': '/preloaded.png'}}
+        url = self.get_field({'thumbnail_manifests': manifests}).to_native(self.user.image)
+
+        self.assertEquals(url, 'http://testserver/preloaded.png')
+        self.assertEquals(stats.get('hits'), 0)
+
+    def test_missing_alias_falls_back_to_the_image(self):
+        field = CroppedImageURLField(source='image', thumbnail_alias='mini')
+        field.context = {'request': RequestFactory().get('/')}
+
+        self.assertTrue(field.to_native(self.user.image).endswith('/images/test.png'))
+
+    def test_load_manifests(self):
+        users = [self.user, User(email='other@example.com', image='images/other.png'),
+                 User(email='noimage@example.com')]
+
+        manifests = load_manifests(users, ['image'])
+        self.assertEquals(manifests.keys(), ['images/test.png'])
+        self.assertEquals(stats.snapshot(), {'hits': 1, 'misses': 1, 'builds': 0})
+
+        self.assertEquals(get_manifests([]), {})
@@ -0,0 +1,211 @@
+"""
+Sliding window rate limiting for the API views.
+
+Each key has a counter per fixed window (`duration` seconds), the rate is
+estimated over the last `duration` seconds by weighting the previous window
+by how much of it still overlaps:
+
+    count = current + previous * (1 - elapsed / duration)
+
+The counters are kept in the cache, so the limits are shared between the
+workers. When the cache fails the counters are kept in-process.
+
+The throttles run in APIView.initial(), before the view handler, so
+rejected requests never get to password hashing or the database. The
+allowed / rejected (total and per scope) counts are in `stats`.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.throttling import SimpleRateThrottle
+
+from .stats import Counters
+
+logger = logging.getLogger('vita_auth.common.throttling')
+
+KEY_PREFIX = 'common.throttling.'
+
+stats = Counters('allowed', 'rejected', 'fallbacks')
+
+
+class LocalCounters(object):
+    """In-process fallback for the cache counters"""
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._counters = {}  # key -> (count, expires)
+
+    def get_many(self, keys):
+        now = time.time()
+        counters = self._counters
+
+        return dict((key, counters[key][0]) for key in keys
+                    if key in counters and counters[key][1] > now)
+
+    def incr(self, key, timeout):
+        now = time.time()
+
+        with self._lock:
+            if len(self._counters) >= self.max_size:
+                self._counters = dict((key, counter) for key, counter in self._counters.iteritems()
+                                      if counter[1] > now)
+
+            count, expires = self._counters.get(key, (0, now + timeout))
+            if expires <= now:
+                count, expires = 0, now + timeout
+
+            self._counters[key] = (count + 1, expires)
+
+    def clear(self):
+        with self._lock:
+            self._counters = {}
+
+
+local_counters = LocalCounters()
+
+
+class CacheCounters(object):
+    def get_many(self, keys):
+        return cache.get_many(keys)
+
+    def incr(self, key, timeout):
+        cache.add(key, 0, timeout)
+        cache.incr(key)
+
+
+cache_counters = CacheCounters()
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """
+    Base class of the sliding window throttles, like SimpleRateThrottle the
+    subclasses implement get_ident().
+
+    The scope is "<view.throttle_scope>_<scope_suffix>", its rate is
+    set in REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+    """
+    scope_suffix = None
+
+    def __init__(self):
+        # The rate depends on the view, see allow_request()
+        pass
+
+    def get_ident(self, request):
+        """The client identifier, None to not throttle the request"""
+        raise NotImplementedError('.get_ident() must be overridden')
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident(request)
+        if ident is None:
+            return None
+
+        ident = hashlib.md5(ident.encode('utf-8')).hexdigest()
+        return '{}{}.{}'.format(KEY_PREFIX, self.scope, ident)
+
+    def get_count(self, counters, key):
+        window = int(self.now // self.duration)
+        current_key, previous_key = '{}.{}'.format(key, window), '{}.{}'.format(key, window - 1)
+
+        values = counters.get_many([current_key, previous_key])
+        overlap = 1 - (self.now % self.duration) / float(self.duration)
+
+        self.window_key = current_key
+        return values.get(current_key, 0) + values.get(previous_key, 0) * overlap
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            return True
+
+        self.scope = '{}_{}'.format(self.scope, self.scope_suffix)
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        self.now = self.timer()
+
+        try:
+            self.count = self.get_count(cache_counters, key)
+            counters = cache_counters
+        except Exception:
+            logger.warning('Throttle counters unavailable, using the local ones', exc_info=True)
+            stats.incr('fallbacks')
+            self.count = self.get_count(local_counters, key)
+            counters = local_counters
+
+        if self.count >= self.num_requests:
+            stats.incr('rejected')
+            stats.incr('rejected.' + self.scope)
+            return False
+
+        self.counters = counters
+        if not getattr(view, 'throttle_failures_only', False):
+            self.record()
+
+        stats.incr('allowed')
+        return True
+
+    def record(self):
+        """Count the request towards the rate"""
+        try:
+            self.counters.incr(self.window_key, 2 * self.duration)
+        except Exception:
+            logger.warning('Throttle counters unavailable, using the local ones', exc_info=True)
+            stats.incr('fallbacks')
+            local_counters.incr(self.window_key, 2 * self.duration)
+
+    def wait(self):
+        """Seconds until the estimated count falls below the limit"""
+        elapsed = self.now % self.duration
+        return max(self.duration - elapsed, 1)
+
+
+class IPRateThrottle(SlidingWindowThrottle):
+    """Limits the requests from an IP address"""
+    scope_suffix = 'ip'
+
+    def get_ident(self, request):
+        return request.META.get('REMOTE_ADDR')
+
+
+class EmailRateThrottle(SlidingWindowThrottle):
+    """Limits the requests for an account, by the submitted `email`"""
+    scope_suffix = 'email'
+
+    def get_ident(self, request):
+        email = request.DATA.get('email') if hasattr(request.DATA, 'get') else None
+        if not email or not isinstance(email, basestring):
+            return None
+
+        return email.strip().lower()
+
+
+class ThrottleFailuresMixin(object):
+    """
+    View mixin, only the requests failing with 400 (e.g. a wrong password)
+    count towards the rates of the sliding window throttles. Requests over
+    the rate are still rejected before the view handler.
+    """
+    throttle_failures_only = True
+
+    def get_throttles(self):
+        self.throttles = super(ThrottleFailuresMixin, self).get_throttles()
+        return self.throttles
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if response.status_code == status.HTTP_400_BAD_REQUEST:
+            for throttle in getattr(self, 'throttles', ()):
+                if getattr(throttle, 'counters', None):
+                    throttle.record()
+
+        return super(ThrottleFailuresMixin, self).finalize_response(
+            request, response, *args, **kwargs)
@@ -0,0 +1,101 @@
+"""
+Thumbnail URL manifests.
+
+The manifest of an image maps each thumbnail alias to its URL. It's stored
+in the cache under the image name, built by CroppedImageURLField the first
+time the image is serialized and rebuilt while thumbnails are missing, so
+the URLs are resolved without going to the thumbnail backend or the storage.
+A changed image has a new name, so it gets a new manifest.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import Signal
+from easy_thumbnails.alias import aliases
+
+from common.stats import Counters
+
+KEY_PREFIX = 'common.thumbnails.'
+
+stats = Counters('hits', 'misses', 'builds')
+
+# Sent by update_manifest when the stored thumbnail URLs of an image changed
+manifest_updated = Signal(providing_args=['instance', 'field', 'manifest'])
+
+
+def _get_key(name):
+    # Image names may contain characters memcached doesn't accept
+    return KEY_PREFIX + hashlib.md5(name.encode('utf-8')).hexdigest()
+
+
+def build_manifest(fieldfile):
+    """
+    Resolve the existing thumbnails of all the aliases (storage lookups).
+    Returns the manifest and whether all the thumbnails exist.
+    """
+    manifest = {}
+    all_aliases = aliases.all()
+
+    for alias, options in all_aliases.iteritems():
+        thumbnail = fieldfile.get_thumbnail(options, generate=False)
+        if thumbnail:
+            manifest[alias] = thumbnail.url
+
+    return manifest, len(manifest) == len(all_aliases)
+
+
+def update_manifest(fieldfile):
+    """Rebuild and store the manifest of `fieldfile`, returns it"""
+    key = _get_key(fieldfile.name)
+    previous = cache.get(key)
+
+    manifest, complete = build_manifest(fieldfile)
+    stats.incr('builds')
+
+    # Thumbnails that don't exist yet are looked up again after a while
+    if complete:
+        timeout = getattr(settings, 'THUMBNAIL_MANIFEST_TIMEOUT', None)
+    else:
+        timeout = getattr(settings, 'THUMBNAIL_MANIFEST_INCOMPLETE_TIMEOUT', 5 * 60)
+
+    cache.set(key, manifest, timeout)
+
+    # A first build has nothing to compare with, the URLs are already served
+    if previous is not None and manifest != previous:
+        instance = fieldfile.instance
+        manifest_updated.send(sender=type(instance), instance=instance,
+                              field=fieldfile.field.name, manifest=manifest)
+
+    return manifest
+
+
+def get_manifests(names):
+    """
+    Returns {image name: manifest} for the names that have a manifest,
+    with a single cache query.
+    """
+    keys = dict((_get_key(name), name) for name in set(names))
+    cached = cache.get_many(keys.keys()) if keys else {}
+
+    stats.incr('hits', len(cached))
+    stats.incr('misses', len(keys) - len(cached))
+
+    return dict((keys[key], manifest) for key, manifest in cached.iteritems())
+
+
+def load_manifests(objects, field_names):
+    """
+    Batch loader for a list response: the manifests of the images in
+    `field_names` of all the `objects`.
+    """
+    names = []
+
+    for obj in objects:
+        for field_name in field_names:
+            fieldfile = getattr(obj, field_name)
+            if fieldfile:
+                names.append(fieldfile.name)
+
+    return get_manifests(names)
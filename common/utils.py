@@ -3,6 +3,7 @@ import uuid
 import string
 import random
 from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
 
 
 def get_image_upload_path(instance, filename):
@@ -33,3 +34,13 @@ def generate_secure_hash():
 def generate_random_string(length):
     return ''.join([random.choice(string.letters + string.digits)
                     for i in range(length)])
+
+
+def is_shared_cache(cache):
+    """
+    False if the entries of `cache` live in the process memory (LocMemCache),
+    i.e. every worker process has its own copy and invalidations don't reach
+    the others. LOCAL_CACHE_IS_SHARED is for single process setups (runserver).
+    """
+    return (not isinstance(cache, LocMemCache) or
+            getattr(settings, 'LOCAL_CACHE_IS_SHARED', False))
@@ -1,4 +1,14 @@
-from rest_framework import generics, response, permissions
+from io import BytesIO
+from urlparse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY, get_user
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.urlresolvers import Resolver404, resolve
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import generics, response, permissions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import APIView
 
 from .viewsets import UpdateUserMixin
 
@@ -10,3 +20,123 @@ class APIRootView(generics.GenericAPIView, UpdateUserMixin):
 
     def get(self, request):
         return response.Response({'name': 'VitaPersonal API', 'version': vita_auth.__version__})
+
+
+class BatchView(generics.GenericAPIView):
+    """
+    Dispatch several API requests in one round trip.
+
+    Expects a list of {"method": "GET", "url": "/api/users/me", "body": {...},
+    "headers": {"If-None-Match": "..."}}, "method", "body" and "headers" are
+    optional. The requests are dispatched in order, in process, and share
+    this request's authentication and session - the middleware runs once.
+    After an item that logs in or out, the later items get the new user.
+    Responds with the list of {"status": ..., "headers": {...}, "body": ...}.
+    """
+    permission_classes = (permissions.AllowAny, )
+
+    # Response headers passed on to the client
+    response_headers = ('ETag', 'Link', 'Location')
+
+    def post(self, request):
+        items = request.DATA
+        max_requests = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+
+        if not isinstance(items, list) or not items or len(items) > max_requests:
+            return response.Response(
+                {'detail': _('Expected a list of at most {count} requests.')
+                 .format(count=max_requests)}, status=status.HTTP_400_BAD_REQUEST)
+
+        self.user = request._request.user
+        self.session_auth = self.get_session_auth(request._request.session)
+
+        return response.Response([self.dispatch_item(request, item) for item in items])
+
+    def get_session_auth(self, session):
+        return session.get(SESSION_KEY), session.get(BACKEND_SESSION_KEY)
+
+    def build_request(self, request, method, url, body, headers):
+        """A copy of the underlying HttpRequest for `url`, sharing its user and session"""
+        parts = urlsplit(url)
+        content = JSONRenderer().render(body) if body is not None else b''
+
+        environ = dict((key, value) for key, value in request._request.META.iteritems()
+                       if not key.startswith('HTTP_IF_') and key != 'HTTP_CONTENT_TYPE')
+        environ.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': parts.path,
+            'QUERY_STRING': parts.query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(content)),
+            'wsgi.input': BytesIO(content),
+        })
+        for name, value in headers.iteritems():
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+
+        sub_request = WSGIRequest(environ)
+        sub_request.session = request._request.session
+
+        # login() and logout() change the shared session, not this request's user
+        session_auth = self.get_session_auth(sub_request.session)
+        if session_auth != self.session_auth:
+            self.user, self.session_auth = get_user(sub_request), session_auth
+        sub_request.user = self.user
+
+        return sub_request
+
+    def clean_headers(self, headers):
+        """The request headers of an item as {str: str}, None if they aren't valid"""
+        if not isinstance(headers, dict):
+            return None
+
+        cleaned = {}
+        for name, value in headers.iteritems():
+            if not isinstance(name, basestring) or not isinstance(value, (basestring, int, long)):
+                return None
+            try:
+                cleaned[str(name)] = str(value)
+            except UnicodeError:  # HTTP headers are ASCII
+                return None
+
+        return cleaned
+
+    def error(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        return {'status': status_code, 'body': {'detail': message}}
+
+    def dispatch_item(self, request, item):
+        if not isinstance(item, dict) or not isinstance(item.get('url'), basestring):
+            return self.error(_('Expected a request with a "url".'))
+
+        headers = self.clean_headers(item.get('headers') or {})
+        if headers is None:
+            return self.error(_('Expected "headers" to be an object of strings.'))
+
+        method = str(item.get('method', 'GET')).upper()
+        sub_request = self.build_request(request, method, item['url'], item.get('body'), headers)
+
+        try:
+            match = resolve(sub_request.path_info)
+        except Resolver404:
+            match = None
+
+        # API views only, and no nested batches
+        view_class = getattr(match, 'func', None) and getattr(match.func, 'cls', None)
+        if (view_class is None or not issubclass(view_class, APIView) or
+                issubclass(view_class, BatchView)):
+            return self.error(_('Not found'), status.HTTP_404_NOT_FOUND)
+
+        sub_response = match.func(sub_request, *match.args, **match.kwargs)
+
+        # Only the data of REST framework responses can be rendered with the batch
+        # (not e.g. the streamed exports)
+        if not isinstance(sub_response, response.Response):
+            return self.error(_('This request can\'t be batched.'))
+
+        body = sub_response.data
+
+        return {
+            'status': sub_response.status_code,
+            'headers': dict((name, sub_response[name]) for name in self.response_headers
+                            if sub_response.has_header(name)),
+            'body': body,
+        }
@@ -1,4 +1,12 @@
-from rest_framework import mixins, viewsets
+import hashlib
+
+from django.db.models.fields import FieldDoesNotExist
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import mixins, status, viewsets
+from rest_framework.response import Response
+
+from .serializers import get_sparse_fields
+from .thumbnails import load_manifests
 
 
 class UpdateUserMixin(object):
@@ -13,6 +21,162 @@ class UpdateUserMixin(object):
             pass
 
 
+class ThumbnailManifestMixin(object):
+    """
+    Loads the thumbnail manifests (common.thumbnails) of the images in
+    `thumbnail_fields` for a whole list response with a single cache query.
+    """
+    thumbnail_fields = ()
+
+    def get_thumbnail_fields(self, serializer):
+        """The `thumbnail_fields` still read by the serializer (after ?fields= / ?exclude=)"""
+        sources = set(field.source or name for name, field in serializer.fields.items())
+        return [name for name in self.thumbnail_fields if name in sources]
+
+    def get_serializer(self, instance=None, *args, **kwargs):
+        serializer = super(ThumbnailManifestMixin, self).get_serializer(instance, *args, **kwargs)
+
+        if kwargs.get('many') and instance is not None and self.thumbnail_fields:
+            # Unselected images aren't read, their columns may be deferred
+            field_names = self.get_thumbnail_fields(serializer)
+            if field_names:
+                serializer.context['thumbnail_manifests'] = load_manifests(instance, field_names)
+
+        return serializer
+
+
+class SparseFieldsQuerysetMixin(object):
+    """
+    Narrows the queryset to the columns of the fields selected with
+    ?fields= / ?exclude= (common.serializers.SparseFieldsMixin).
+
+    Nothing is narrowed if a selected field isn't backed by a model field
+    (e.g. method fields) - it might use any attribute. The columns of
+    get_required_columns() (e.g. the cursor ordering) are never deferred.
+    """
+
+    def get_required_columns(self):
+        """Columns the view reads from every object, whatever the selected fields"""
+        return set(getattr(self, 'cursor_ordering', ()))
+
+    def get_sparse_columns(self, field_names):
+        """The model fields the serializer fields `field_names` read, or None if unknown"""
+        serializer_fields = self.get_serializer_class().base_fields
+        columns = set()
+
+        for name in field_names:
+            field = serializer_fields.get(name)
+            source = getattr(field, 'source', None) or name
+
+            try:
+                model_field, _, direct, m2m = self.model._meta.get_field_by_name(source)
+            except FieldDoesNotExist:
+                return None
+
+            if direct and not m2m:
+                columns.add(model_field.name)
+
+        return columns
+
+    def get_queryset(self):
+        queryset = super(SparseFieldsQuerysetMixin, self).get_queryset()
+        requested, excluded = get_sparse_fields(self.request)
+
+        if not hasattr(queryset, 'only'):
+            return queryset
+
+        if requested:
+            columns = self.get_sparse_columns(requested)
+            if columns is not None:
+                columns |= self.get_required_columns()
+                return queryset.only(self.model._meta.pk.name, *columns)
+
+        elif excluded:
+            # Only fully excluded fields, not the ones excluded from a nested serializer
+            excluded = set(name for name, nested in excluded.iteritems() if not nested)
+            remaining = [name for name in getattr(self.get_serializer_class().Meta, 'fields', ())
+                         if name not in excluded]
+
+            columns = self.get_sparse_columns(excluded)
+            used_columns = self.get_sparse_columns(remaining) if remaining else None
+
+            if columns and used_columns is not None:
+                columns -= used_columns | self.get_required_columns()
+                columns.discard(self.model._meta.pk.name)
+                if columns:
+                    return queryset.defer(*columns)
+
+        return queryset
+
+
+class PrefetchRelatedMixin(object):
+    """
+    Prefetches the `prefetch_related` relations (serialized by nested
+    serializers) in bulk, instead of a query per object. Relations left out
+    with ?fields= / ?exclude= aren't prefetched.
+    """
+    prefetch_related = ()
+
+    def get_prefetch_related(self):
+        requested, excluded = get_sparse_fields(self.request)
+
+        return [name for name in self.prefetch_related
+                if (not requested or name in requested) and excluded.get(name) != {}]
+
+    def get_queryset(self):
+        queryset = super(PrefetchRelatedMixin, self).get_queryset()
+        prefetch_related = self.get_prefetch_related()
+
+        if prefetch_related and hasattr(queryset, 'prefetch_related'):
+            queryset = queryset.prefetch_related(*prefetch_related)
+
+        return queryset
+
+
+class ConditionalGetMixin(object):
+    """
+    Answers list() / retrieve() requests with a matching If-None-Match header
+    with 304 Not Modified, before anything is loaded or serialized.
+
+    get_etag_version() returns a version of all the data the response
+    depends on, or None to skip the check. The ETag also covers the
+    requesting user, the query string and the response format.
+    """
+
+    def get_etag_version(self, request, *args, **kwargs):
+        return None
+
+    def get_etag(self, request, *args, **kwargs):
+        version = self.get_etag_version(request, *args, **kwargs)
+        if version is None:
+            return None
+
+        key = u'|'.join((self.__class__.__name__, self.action, unicode(version),
+                         unicode(request.user.pk), request.accepted_renderer.format,
+                         request.GET.urlencode()))
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def conditional_get(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request, *args, **kwargs)
+
+        if etag is not None and etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = quote_etag(etag)
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(super(ConditionalGetMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_get(super(ConditionalGetMixin, self).retrieve,
+                                    request, *args, **kwargs)
+
+
 class NoDeleteModelViewSet(mixins.CreateModelMixin,
                            mixins.RetrieveModelMixin,
                            mixins.UpdateModelMixin,
@@ -0,0 +1,150 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from common.stats import Counters
+
+logger = logging.getLogger('vita_auth.profiles.activity')
+
+
+class ActivityBuffer(object):
+    """
+    Write-behind buffer for User.last_activity / User.last_ip.
+
+    Keeps the latest activity timestamp and IP per user in memory and
+    writes them to the database in one transaction when either
+    `flush_interval` seconds passed since the last flush or `flush_threshold`
+    users are pending.
+
+    Activity closer than `granularity` seconds to the last known activity
+    (from the same IP) is not recorded at all.
+    """
+
+    def __init__(self, flush_interval=None, flush_threshold=None, granularity=None):
+        self.flush_interval = (flush_interval if flush_interval is not None
+                               else getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 30))
+        self.flush_threshold = (flush_threshold if flush_threshold is not None
+                                else getattr(settings, 'ACTIVITY_FLUSH_THRESHOLD', 500))
+        self.granularity = timedelta(seconds=(
+            granularity if granularity is not None
+            else getattr(settings, 'ACTIVITY_GRANULARITY', 60)))
+
+        self.stats = Counters('recorded', 'skipped', 'flushes', 'flushed_rows',
+                              'flush_errors')
+
+        self._lock = threading.Lock()
+        self._pending = {}  # user pk -> (last_activity, last_ip, ip_changed)
+        self._flushed = {}  # entries written within the last `granularity`
+        self._oldest_pending = None  # time.time() of the oldest unflushed entry
+        self._last_flush = time.time()
+
+    def record(self, user, ip, now=None):
+        """
+        Record activity for `user` coming from `ip`.
+
+        Updates the in-memory user object, returns False if the update
+        was skipped because of the time granularity.
+        """
+        now = now or timezone.now()
+
+        with self._lock:
+            # The user object might be older than what's already buffered / written
+            pending = self._pending.get(user.pk)
+            last_activity, last_ip = (pending or self._flushed.get(user.pk) or
+                                      (user.last_activity, user.last_ip))[:2]
+
+            if last_ip == ip and last_activity and now - last_activity < self.granularity:
+                self.stats.incr('skipped')
+                return False
+
+            # A new IP changes the serialized user, so the flush bumps User.version
+            ip_changed = last_ip != ip or bool(pending and pending[2])
+            self._pending[user.pk] = (now, ip, ip_changed)
+
+            if self._oldest_pending is None:
+                self._oldest_pending = time.time()
+
+            due = (len(self._pending) >= self.flush_threshold or
+                   time.time() - self._last_flush >= self.flush_interval)
+
+        self.stats.incr('recorded')
+        user.last_activity = now
+        user.last_ip = ip
+
+        if due:
+            self.flush()
+
+        return True
+
+    def flush(self):
+        """
+        Write all pending updates. Returns the number of users written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            oldest_pending, self._oldest_pending = self._oldest_pending, None
+            self._last_flush = time.time()
+
+        if not pending:
+            return 0
+
+        User = get_user_model()
+
+        try:
+            with transaction.atomic():
+                for pk, (last_activity, last_ip, ip_changed) in pending.iteritems():
+                    values = {'last_activity': last_activity, 'last_ip': last_ip}
+                    if ip_changed:
+                        values['version'] = F('version') + 1
+                    User.objects.filter(pk=pk).update(**values)
+        except DatabaseError:
+            logger.exception('Error flushing activity for %d users', len(pending))
+            self.stats.incr('flush_errors')
+
+            # Put the entries back, unless newer activity was recorded meanwhile
+            with self._lock:
+                for pk, entry in pending.iteritems():
+                    self._pending.setdefault(pk, entry)
+                self._oldest_pending = oldest_pending
+            return 0
+
+        from .cache import invalidate_row_version, invalidate_user
+        for pk, entry in pending.iteritems():
+            invalidate_user(pk)  # update() doesn't send post_save
+            if entry[2]:
+                invalidate_row_version(pk)
+
+        with self._lock:
+            expired = timezone.now() - self.granularity
+            self._flushed = dict((pk, entry[:2]) for pk, entry in self._flushed.iteritems()
+                                 if entry[0] > expired)
+            self._flushed.update((pk, entry[:2]) for pk, entry in pending.iteritems())
+
+        self.stats.incr('flushes')
+        self.stats.incr('flushed_rows', len(pending))
+
+        return len(pending)
+
+    def lag(self):
+        """Age in seconds of the oldest activity that's not written yet"""
+        oldest_pending = self._oldest_pending
+        return time.time() - oldest_pending if oldest_pending else 0
+
+    def get_stats(self):
+        stats = self.stats.snapshot()
+        stats['pending'] = len(self._pending)
+        stats['lag'] = self.lag()
+        return stats
+
+
+activity_buffer = ActivityBuffer()
+
+atexit.register(activity_buffer.flush)
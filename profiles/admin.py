@@ -1,9 +1,11 @@
 from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
+from django.db.models import F
 from django.utils.translation import ugettext_lazy as _
 
-from models import User, MedicalProfile
+from .models import User, MedicalProfile
+from .cache import invalidate_row_version, invalidate_user
 
 
 class UserCreationForm(forms.ModelForm):
@@ -72,7 +74,12 @@ class UserAdmin(DjangoUserAdmin):
 
     def close_user_account(self, request, queryset):
         """Custom admin action for closing user accounts"""
-        queryset.update(status=User.Status.CLOSED)
+        pks = list(queryset.values_list('pk', flat=True))
+        queryset.update(status=User.Status.CLOSED, version=F('version') + 1)
+
+        for pk in pks:  # update() doesn't send post_save
+            invalidate_user(pk)
+            invalidate_row_version(pk)
 
 admin.site.register(User)
 admin.site.register(MedicalProfile)
@@ -0,0 +1,120 @@
+"""
+Versioned, per-user cache entries.
+
+Every user has a version number in the cache, and the user object is
+cached under a key that includes it. Invalidating a user bumps the version,
+so stale entries are never read again (and expire on their own). Only
+a cache shared by all the workers sees their invalidations, with a
+per-process cache the users are always read from the database.
+
+Writes that don't send post_save (QuerySet.update()) have to call
+invalidate_user() themselves.
+
+The cache also holds a marker of each user's row version (User.version),
+used for the ETags of the user's endpoints (see ConditionalGetMixin).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from common.stats import Counters
+from common.utils import is_shared_cache
+
+from .models import User
+
+VERSION_KEY = 'profiles.user.{pk}.version'
+USER_KEY = 'profiles.user.{pk}.{version}'
+ROW_VERSION_KEY = 'profiles.user.{pk}.row_version'
+
+stats = Counters('hits', 'misses', 'invalidations')
+
+
+def _new_version():
+    # Unique enough to never match an entry cached before the version
+    # key got evicted
+    return int(time.time() * 1000)
+
+
+def get_user_version(pk):
+    key = VERSION_KEY.format(pk=pk)
+    version = cache.get(key)
+
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+
+    return version
+
+
+def get_cached_user(pk):
+    """
+    Returns the user with the primary key `pk` from the cache, or from the
+    database if it isn't cached. Returns None if there's no such user.
+    """
+    if not is_shared_cache(cache):
+        return User.objects.filter(pk=pk).first()
+
+    key = USER_KEY.format(pk=pk, version=get_user_version(pk))
+    user = cache.get(key)
+
+    if user is not None:
+        stats.incr('hits')
+        return user
+
+    stats.incr('misses')
+
+    try:
+        user = User.objects.get(pk=pk)
+    except User.DoesNotExist:
+        return None
+
+    cache.set(key, user, getattr(settings, 'USER_CACHE_TIMEOUT', 60 * 60))
+    return user
+
+
+def invalidate_user(pk):
+    """Bump the user's version, so the cached object isn't used anymore"""
+    key = VERSION_KEY.format(pk=pk)
+    stats.incr('invalidations')
+
+    try:
+        cache.incr(key)
+    except ValueError:  # Not in the cache
+        cache.set(key, _new_version(), None)
+
+
+def get_row_version(pk):
+    """
+    The user's User.version, from the cache marker if available (and
+    shared by the workers). Returns None if there's no such user.
+    """
+    key = ROW_VERSION_KEY.format(pk=pk)
+    version = cache.get(key) if is_shared_cache(cache) else None
+
+    if version is None:
+        version = User.objects.filter(pk=pk).values_list('version', flat=True).first()
+        if version is not None:
+            cache.set(key, version, getattr(settings, 'USER_CACHE_TIMEOUT', 60 * 60))
+
+    return version
+
+
+def set_row_version(pk, version):
+    cache.set(ROW_VERSION_KEY.format(pk=pk), version,
+              getattr(settings, 'USER_CACHE_TIMEOUT', 60 * 60))
+
+
+def invalidate_row_version(pk):
+    cache.delete(ROW_VERSION_KEY.format(pk=pk))
+
+
+def bump_row_version(pk):
+    """
+    For changes to data serialized with the user that don't save the user
+    (e.g. the user's profiles)
+    """
+    User.objects.filter(pk=pk).update(version=F('version') + 1)
+    invalidate_row_version(pk)
@@ -0,0 +1,115 @@
+"""
+Streaming CSV / JSON lines export of the users and medical profiles.
+
+Rows are read in primary key chunks (values_list, no model instances) and
+encoded as they're read, so the memory use doesn't depend on the table size.
+Used by ExportView and the export_data command.
+"""
+
+import csv
+import zlib
+from io import BytesIO
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import MedicalProfile, User
+
+# The exported fields (attnames), the password hash is never exported
+EXPORTS = {
+    'users': (User, ('id', 'email', 'account_name', 'first_name', 'last_name', 'phone',
+                     'is_staff', 'is_superuser', 'registration_ip', 'last_ip',
+                     'last_activity', 'last_login', 'timezone', 'image',
+                     'show_welcome_dialog')),
+    'profiles': (MedicalProfile, tuple(field.attname
+                                       for field in MedicalProfile._meta.concrete_fields)),
+}
+
+FORMATS = ('csv', 'jsonl')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def iter_rows(model, fields, chunk_size=1000):
+    """The `fields` value tuples of all the `model` rows, in primary key order"""
+    queryset = model._default_manager.order_by('pk').values_list(*fields)
+    pk_index = fields.index('id')
+    last_pk = 0
+
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not rows:
+            return
+
+        for row in rows:
+            yield row
+
+        last_pk = rows[-1][pk_index]
+
+
+def encode_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_csv(rows, fields, lines_per_chunk=100):
+    buf = BytesIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+
+    for i, row in enumerate(rows, 1):
+        writer.writerow([encode_value(value) for value in row])
+
+        if i % lines_per_chunk == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+
+    yield buf.getvalue()
+
+
+def iter_jsonl(rows, fields, lines_per_chunk=100):
+    encoder = JSONEncoder()
+    lines = []
+
+    for row in rows:
+        # TimeZoneField values are tzinfo objects
+        values = [unicode(value) if hasattr(value, 'zone') else value for value in row]
+        lines.append(encoder.encode(dict(zip(fields, values))))
+
+        if len(lines) == lines_per_chunk:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)  # gzip header
+
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def export(name, fmt='csv', gzip=False, chunk_size=1000):
+    """
+    Returns an iterator over the encoded `name` export ("users" or "profiles")
+    as byte strings.
+    """
+    model, fields = EXPORTS[name]
+    rows = iter_rows(model, fields, chunk_size)
+    chunks = (iter_csv if fmt == 'csv' else iter_jsonl)(rows, fields)
+
+    return iter_gzip(chunks) if gzip else chunks
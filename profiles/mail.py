@@ -0,0 +1,142 @@
+"""
+Email outbox.
+
+Requests only queue messages (queue_mail), the send_queued_mail command sends
+them in batches over one SMTP connection. Failed messages are retried with
+an exponential backoff, up to MAIL_MAX_ATTEMPTS times.
+
+Locally, an SMTP stand-in that prints the messages is enough:
+
+    python -m smtpd -n -c DebuggingServer localhost:1025
+
+with EMAIL_HOST = 'localhost', EMAIL_PORT = 1025 and EMAIL_USE_TLS = False.
+"""
+
+import logging
+import smtplib
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from common.stats import Counters
+
+from .models import QueuedEmail
+
+logger = logging.getLogger('vita_auth.profiles.mail')
+
+stats = Counters('queued', 'sent', 'retried', 'failed')
+
+# Errors worth retrying, anything else is a bug
+SEND_ERRORS = (smtplib.SMTPException, socket.error)
+
+
+def queue_mail(subject, body, from_email, recipients, html_body=''):
+    """Queue a message, returns the QueuedEmail"""
+    email = QueuedEmail.objects.create(subject=subject, body=body, html_body=html_body,
+                                       from_email=from_email, recipients='\n'.join(recipients))
+    stats.incr('queued')
+    return email
+
+
+def get_retry_delay(attempts):
+    """Seconds to wait after the `attempts`th failed attempt"""
+    delay = getattr(settings, 'MAIL_RETRY_DELAY', 60)
+    max_delay = getattr(settings, 'MAIL_MAX_RETRY_DELAY', 60 * 60)
+    return min(delay * 2 ** (attempts - 1), max_delay)
+
+
+def get_message(email, connection=None):
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email,
+                                     email.recipients.split('\n'), connection=connection)
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
+
+
+def claim_batch(batch_size, now=None):
+    """
+    The next `batch_size` messages due. They aren't due again for
+    MAIL_SEND_TIMEOUT seconds, so concurrent workers skip them.
+    """
+    now = now or timezone.now()
+    timeout = timedelta(seconds=getattr(settings, 'MAIL_SEND_TIMEOUT', 5 * 60))
+
+    with transaction.atomic():
+        batch = list(QueuedEmail.objects.select_for_update()
+                     .filter(status=QueuedEmail.Status.QUEUED, next_attempt__lte=now)
+                     .order_by('next_attempt')[:batch_size])
+        if batch:
+            QueuedEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt=now + timeout)
+
+    return batch
+
+
+def send_batch(batch, connection):
+    """
+    Send the messages of `batch` over `connection`, record the results.
+    Returns the number of messages sent.
+    """
+    sent = []
+
+    for email in batch:
+        try:
+            connection.open()  # no-op while connected
+            get_message(email, connection).send()
+        except SEND_ERRORS as exc:
+            logger.warning('Sending %s failed: %r', email.pk, exc)
+            connection.close()  # reconnect for the next message
+            record_failure(email, exc)
+        except Exception as exc:  # e.g. a message that can't be encoded, the others are sent
+            logger.exception('Sending %s failed', email.pk)
+            connection.close()
+            record_failure(email, exc)
+        else:
+            sent.append(email.pk)
+
+    # The sent bodies can contain passwords, they're not kept
+    QueuedEmail.objects.filter(pk__in=sent).update(
+        status=QueuedEmail.Status.SENT, sent=timezone.now(), body='', html_body='')
+    stats.incr('sent', len(sent))
+
+    return len(sent)
+
+
+def record_failure(email, exc):
+    attempts = email.attempts + 1
+    updates = {'attempts': attempts, 'last_error': repr(exc)}
+
+    if attempts >= getattr(settings, 'MAIL_MAX_ATTEMPTS', 8):
+        logger.error('Giving up sending %s after %s attempts', email.pk, attempts)
+        updates.update(status=QueuedEmail.Status.FAILED, body='', html_body='')  # like the sent
+        stats.incr('failed')
+    else:
+        updates['next_attempt'] = timezone.now() + timedelta(seconds=get_retry_delay(attempts))
+        stats.incr('retried')
+
+    QueuedEmail.objects.filter(pk=email.pk).update(**updates)
+
+
+def send_queued_mail(batch_size=None, connection=None):
+    """
+    Send the queued messages that are due, in batches of `batch_size` over
+    a single connection. Returns the number of messages sent.
+    """
+    batch_size = batch_size or getattr(settings, 'MAIL_BATCH_SIZE', 100)
+    connection = connection or get_connection()
+    sent = 0
+
+    try:
+        while True:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            sent += send_batch(batch, connection)
+    finally:
+        connection.close()
+
+    return sent
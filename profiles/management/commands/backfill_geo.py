@@ -0,0 +1,77 @@
+import time
+from collections import defaultdict
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from common.geoip import IPRangeIndex, country_timezone, ip_to_int
+from profiles.models import User
+
+
+class Command(BaseCommand):
+    help = ("Fill in the timezone of users that have a registration ip, "
+            "but whose country/timezone were never resolved")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=2000,
+                    help='Number of users read, resolved and updated at once'),
+        make_option('--dry-run', action='store_true', default=False,
+                    help="Resolve, but don't write anything"),
+    )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+
+        start = time.time()
+        index = IPRangeIndex.from_file()
+        self.stdout.write('Loaded {} IP ranges in {:.2f}s'.format(len(index), time.time() - start))
+
+        queryset = (User.objects.filter(registration_ip__isnull=False, timezone__isnull=True)
+                    .exclude(registration_ip='').order_by('pk'))
+
+        last_pk = 0
+        processed = updated = 0
+        start = time.time()
+
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk)
+                        .values_list('pk', 'registration_ip')[:chunk_size])
+            if not rows:
+                break
+
+            last_pk = rows[-1][0]
+            processed += len(rows)
+
+            by_timezone = self.resolve(index, rows)
+
+            if not dry_run:
+                with transaction.atomic():
+                    for timezone, pks in by_timezone.iteritems():
+                        User.objects.filter(pk__in=pks).update(timezone=timezone)
+
+            updated += sum(len(pks) for pks in by_timezone.itervalues())
+
+            elapsed = time.time() - start
+            self.stdout.write('{:,} users processed, {:,} updated, {:,.0f} users/sec'
+                              .format(processed, updated, processed / elapsed))
+
+        self.stdout.write('Done: {:,} users processed, {:,} updated in {:.2f}s'
+                          .format(processed, updated, time.time() - start))
+
+    def resolve(self, index, rows):
+        """
+        Returns {timezone: [user pks]} for a chunk of (pk, ip) rows.
+        """
+        addresses = sorted((ipnum, pk) for ipnum, pk in ((ip_to_int(ip), pk) for pk, ip in rows)
+                           if ipnum is not None)
+        countries = index.lookup_sorted([ipnum for ipnum, pk in addresses])
+
+        by_timezone = defaultdict(list)
+        for (ipnum, pk), country in zip(addresses, countries):
+            timezone = country_timezone(country)
+            if timezone:
+                by_timezone[timezone].append(pk)
+
+        return by_timezone
@@ -0,0 +1,91 @@
+import timeit
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+
+from authentication import SessionAuthenticationNoCSRF, SignedTokenAuthentication
+from common.sessions import SessionStore
+from profiles.middleware import CachedAuthenticationMiddleware
+from profiles.models import User
+from profiles.tokens import make_token
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compare the authentication overhead per request: database sessions, '
+            'cached sessions and signed tokens (the benchmark user is rolled back)')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--number', type='int', default=2000,
+                    help='Number of authenticated requests per run'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['number'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def make_session(self, store_class, user):
+        session = store_class()
+        session[SESSION_KEY] = user.pk
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session.save()
+        return session.session_key
+
+    def run(self, number):
+        user = User.objects.create(email='benchmark-auth@example.com', account_name='benchmark')
+        factory = RequestFactory()
+
+        def session_auth(store_class, middleware_class, session_key):
+            def authenticate():
+                request = factory.get('/api/users/me')
+                request.COOKIES[settings.SESSION_COOKIE_NAME] = session_key
+                request.session = store_class(session_key)
+                middleware_class().process_request(request)
+                return Request(request, authenticators=[SessionAuthenticationNoCSRF()]).user
+            return authenticate
+
+        def token_auth(token):
+            def authenticate():
+                request = factory.get('/api/users/me', HTTP_AUTHORIZATION='Token ' + token)
+                SessionMiddleware().process_request(request)
+                CachedAuthenticationMiddleware().process_request(request)
+                return Request(request, authenticators=[SessionAuthenticationNoCSRF(),
+                                                        SignedTokenAuthentication()]).user
+            return authenticate
+
+        runs = (
+            ('db session + db user', session_auth(
+                DBStore, AuthenticationMiddleware, self.make_session(DBStore, user))),
+            ('cached session + user', session_auth(
+                SessionStore, CachedAuthenticationMiddleware, self.make_session(SessionStore, user))),
+            ('signed token', token_auth(make_token(user))),
+        )
+
+        self.stdout.write('{:<24}{:>14}{:>16}'.format('auth', 'us / request', 'queries / req'))
+
+        for name, authenticate in runs:
+            assert authenticate() == user
+            authenticate()  # warm up caches
+
+            with CaptureQueriesContext(connection) as queries:
+                authenticate()
+
+            elapsed = timeit.timeit(authenticate, number=number)
+            self.stdout.write('{:<24}{:>14.2f}{:>16}'.format(
+                name, elapsed / number * 1e6, len(queries)))
@@ -0,0 +1,64 @@
+import random
+import timeit
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from profiles.models import MedicalProfile, User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compare flag filters on the boolean columns of MedicalProfile with the packed '
+            'flags column (the benchmark rows are rolled back)')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--profiles', type='int', default=20000,
+                    help='Number of benchmark profiles'),
+        make_option('--number', type='int', default=20,
+                    help='Number of queries per run'),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['profiles'], options['number'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, number):
+        field = MedicalProfile._meta.get_field('flags')
+        user = User.objects.create(email='benchmark-bitfield@example.com', account_name='benchmark')
+
+        MedicalProfile.objects.bulk_create(
+            [MedicalProfile(user=user, **dict((flag, random.random() < 0.3) for flag in field.flags))
+             for i in range(count)], batch_size=500)
+
+        # The boolean columns are kept, the packed copy is an extra column: on MySQL a
+        # BooleanField is a TINYINT (1 byte) and the BitField an INT (4 bytes)
+        self.stdout.write('Row size of the flags: {} bytes of boolean columns + 4 bytes packed '
+                          'copy\n'.format(len(field.flags)))
+
+        all_of, any_of = ('smoker', 'vegetarian'), ('pregnancy', 'lactation', 'contraceptives')
+        profiles = MedicalProfile.objects
+
+        runs = (
+            ('all of, boolean columns', profiles.filter(**dict.fromkeys(all_of, True))),
+            ('all of, packed', profiles.all_of(*all_of)),
+            ('any of, boolean columns', profiles.filter(
+                reduce(lambda q, flag: q | Q(**{flag: True}), any_of, Q()))),
+            ('any of, packed', profiles.any_of(*any_of)),
+        )
+
+        self.stdout.write('{:<28}{:>10}{:>14}'.format('filter', 'rows', 'ms / query'))
+
+        for name, queryset in runs:
+            rows = queryset.count()
+            elapsed = timeit.timeit(queryset.count, number=number)
+            self.stdout.write('{:<28}{:>10}{:>14.2f}'.format(name, rows, elapsed / number * 1000))
@@ -0,0 +1,52 @@
+import random
+import socket
+import struct
+import time
+from optparse import make_option
+
+import pygeoip
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.geoip import GeoIPResolver
+
+
+class Command(BaseCommand):
+    help = 'Compare GeoIP country lookups/sec: pygeoip per call vs. the shared resolver'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--lookups', type='int', default=100000,
+                    help='Number of lookups per run'),
+        make_option('--unique', type='int', default=5000,
+                    help='Number of distinct IPs the lookups are drawn from'),
+    )
+
+    def handle(self, *args, **options):
+        rnd = random.Random(42)
+        unique = [socket.inet_ntoa(struct.pack('!I', rnd.randint(0x01000000, 0xDFFFFFFF)))
+                  for i in range(options['unique'])]
+        # Skewed towards a small set of active users, like real traffic
+        ips = [unique[min(int(rnd.expovariate(10.0 / len(unique))), len(unique) - 1)]
+               for i in range(options['lookups'])]
+
+        def current(ip):
+            return pygeoip.GeoIP(settings.GEOIP_PATH).country_code_by_addr(ip)
+
+        uncached = GeoIPResolver(cache_size=1)
+        cached = GeoIPResolver()
+
+        runs = (
+            ('pygeoip.GeoIP() per call', current),
+            ('resolver, mmap, no cache', uncached.country_code_by_addr),
+            ('resolver, mmap + LRU cache', cached.country_code_by_addr),
+        )
+
+        for name, lookup in runs:
+            lookup(ips[0])  # open the database outside of the timing
+
+            start = time.time()
+            for ip in ips:
+                lookup(ip)
+            elapsed = time.time() - start
+
+            self.stdout.write('{:<30} {:>12,.0f} lookups/sec'.format(name, len(ips) / elapsed))
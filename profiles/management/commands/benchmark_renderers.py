@@ -0,0 +1,60 @@
+import timeit
+import zlib
+from io import BytesIO
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from common.parsers import MessagePackParser
+from common.renderers import MessagePackRenderer
+from profiles.models import MedicalProfile, User
+from profiles.serializers import MedicalProfileSerializer, UserSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compare JSON and MessagePack for user and profile lists: bytes on the wire '
+            '(plain and deflated) and render / parse time')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--objects', type='int', default=100,
+                    help='Number of objects per list'),
+        make_option('--number', type='int', default=200,
+                    help='Number of render / parse calls per run'),
+    )
+
+    def handle(self, *args, **options):
+        count, number = options['objects'], options['number']
+
+        profiles = [MedicalProfile(id=i, user_id=i, name=u'profile %d' % i,
+                                   age=MedicalProfile.Age.ADULT, birthday=timezone.now(),
+                                   melanin=2, smoker=bool(i % 2))
+                    for i in range(count)]
+        users = [User(id=i, email='user%d@example.com' % i, account_name=u'user %d' % i)
+                 for i in range(count)]
+
+        lists = (
+            ('users', UserSerializer(users, many=True).data),
+            ('profiles', MedicalProfileSerializer(profiles, many=True).data),
+        )
+
+        formats = (
+            ('json', JSONRenderer(), JSONParser()),
+            ('msgpack', MessagePackRenderer(), MessagePackParser()),
+        )
+
+        self.stdout.write('{:<10}{:<10}{:>10}{:>12}{:>14}{:>14}'.format(
+            'list', 'format', 'bytes', 'deflated', 'render (us)', 'parse (us)'))
+
+        for list_name, data in lists:
+            for format_name, renderer, parser in formats:
+                content = renderer.render(data)
+
+                render_time = timeit.timeit(lambda: renderer.render(data), number=number)
+                parse_time = timeit.timeit(lambda: parser.parse(BytesIO(content)), number=number)
+
+                self.stdout.write('{:<10}{:<10}{:>10}{:>12}{:>14.1f}{:>14.1f}'.format(
+                    list_name, format_name, len(content), len(zlib.compress(content)),
+                    render_time / number * 1e6, parse_time / number * 1e6))
@@ -0,0 +1,56 @@
+import timeit
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from profiles.models import MedicalProfile, User
+from profiles.serializers import MedicalProfileNestedSerializer, UserSerializer
+
+
+def uncompiled(serializer_class):
+    class Meta(serializer_class.Meta):
+        compiled = False
+
+    return type('Uncompiled' + serializer_class.__name__, (serializer_class, ), {'Meta': Meta})
+
+
+class Command(BaseCommand):
+    help = ('Compare the per-object serialization time of the regular and the compiled '
+            'to_native() (in-memory objects, no database access)')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--objects', type='int', default=1000,
+                    help='Number of objects per serializer call'),
+        make_option('--number', type='int', default=20,
+                    help='Number of serializer calls per run'),
+    )
+
+    def handle(self, *args, **options):
+        count, number = options['objects'], options['number']
+
+        profiles = [MedicalProfile(id=i, name='profile %d' % i, age=MedicalProfile.Age.ADULT,
+                                   birthday=timezone.now(), melanin=2, smoker=bool(i % 2))
+                    for i in range(count)]
+        users = [User(id=i, email='user%d@example.com' % i, account_name='user %d' % i)
+                 for i in range(count)]
+
+        runs = (
+            ('MedicalProfileNestedSerializer', MedicalProfileNestedSerializer, profiles),
+            ('UserSerializer', UserSerializer, users),
+        )
+
+        self.stdout.write('{:<32}{:>16}{:>16}{:>10}'.format(
+            'serializer', 'regular (us)', 'compiled (us)', 'speedup'))
+
+        for name, serializer_class, objects in runs:
+            timings = []
+
+            for cls in (uncompiled(serializer_class), serializer_class):
+                assert cls(objects[:1], many=True).data  # warm up the plan
+
+                timings.append(timeit.timeit(lambda: cls(objects, many=True).data,
+                                             number=number) / number / count * 1e6)
+
+            self.stdout.write('{:<32}{:>16.2f}{:>16.2f}{:>9.1f}x'.format(
+                name, timings[0], timings[1], timings[0] / timings[1]))
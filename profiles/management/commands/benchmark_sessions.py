@@ -0,0 +1,69 @@
+import timeit
+from optparse import make_option
+
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.base import SessionBase
+from django.contrib.sessions.serializers import JSONSerializer, PickleSerializer
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common.sessions import CompactSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compare session serializers: stored bytes, serializer dumps/loads time '
+            'and full session encode/decode (including the HMAC) time')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--number', type='int', default=50000,
+                    help='Number of encode/decode calls per serializer'),
+    )
+
+    def handle(self, *args, **options):
+        number = options['number']
+
+        sessions = (
+            ('login', {
+                SESSION_KEY: 12345,
+                BACKEND_SESSION_KEY: 'django.contrib.auth.backends.ModelBackend',
+            }),
+            ('login + extras', {
+                SESSION_KEY: 12345,
+                BACKEND_SESSION_KEY: 'django.contrib.auth.backends.ModelBackend',
+                'django_timezone': 'Asia/Jerusalem',
+                'last_seen': timezone.now(),
+                'profile_ids': [1, 2, 3],
+            }),
+        )
+        serializers = (
+            ('pickle', PickleSerializer),
+            ('json', JSONSerializer),
+            ('compact', CompactSerializer),
+        )
+
+        self.stdout.write('{:<16}{:<10}{:>8}{:>12}{:>12}{:>14}{:>14}'.format(
+            'session', 'format', 'bytes', 'dumps (us)', 'loads (us)',
+            'encode (us)', 'decode (us)'))
+
+        for session_name, session in sessions:
+            for serializer_name, serializer in serializers:
+                store = SessionBase()
+                store.serializer = serializer
+
+                try:
+                    encoded = store.encode(session)
+                except TypeError:
+                    continue  # e.g. datetimes with the JSONSerializer
+
+                instance = serializer()
+                serialized = instance.dumps(session)
+
+                timings = [timeit.timeit(func, number=number) / number * 1e6 for func in (
+                    lambda: instance.dumps(session),
+                    lambda: instance.loads(serialized),
+                    lambda: store.encode(session),
+                    lambda: store.decode(encoded),
+                )]
+
+                self.stdout.write('{:<16}{:<10}{:>8}{:>12.2f}{:>12.2f}{:>14.2f}{:>14.2f}'.format(
+                    session_name, serializer_name, len(encoded), *timings))
@@ -0,0 +1,52 @@
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_by_path
+
+
+class Command(BaseCommand):
+    help = ('Time the configured password hashers on this host and recommend '
+            'iteration counts for a target hashing time')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--target-ms', type='float', default=100,
+                    help='Target time of one password hash, in milliseconds'),
+        make_option('--samples', type='int', default=5,
+                    help='Number of hashes timed per hasher (the median is used)'),
+    )
+
+    def time_hasher(self, hasher, samples):
+        salt = hasher.salt()
+        timings = []
+
+        for i in range(samples):
+            start = time.time()
+            hasher.encode('calibrate-hashers', salt)
+            timings.append(time.time() - start)
+
+        return sorted(timings)[len(timings) // 2]
+
+    def handle(self, *args, **options):
+        target = options['target_ms'] / 1000.0
+
+        self.stdout.write('{:<32}{:>12}{:>12}{:>14}'.format(
+            'hasher', 'iterations', 'ms / hash', 'recommended'))
+
+        for path in settings.PASSWORD_HASHERS:
+            hasher = import_by_path(path)()
+            iterations = getattr(hasher, 'iterations', None)
+            if not isinstance(iterations, int):
+                continue  # not iteration based (bcrypt rounds, salted digests)
+
+            elapsed = self.time_hasher(hasher, options['samples'])
+
+            # The time is linear in the iteration count, rounded to thousands
+            recommended = max(1000, int(round(iterations * target / elapsed, -3)))
+
+            self.stdout.write('{:<32}{:>12}{:>12.1f}{:>14}'.format(
+                hasher.__class__.__name__, iterations, elapsed * 1000, recommended))
+
+        self.stdout.write('\nSet PASSWORD_HASHER_ITERATIONS to the recommendation of '
+                          'the first hasher, existing hashes are updated on login.')
@@ -0,0 +1,35 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.export import EXPORTS, FORMATS, export
+
+
+class Command(BaseCommand):
+    args = '<users | profiles>'
+    help = 'Stream all the users or medical profiles as CSV or JSON lines (profiles.export)'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=FORMATS, default='csv',
+                    help='Output format: csv (default) or jsonl'),
+        make_option('--gzip', action='store_true', default=False,
+                    help='Gzip the output'),
+        make_option('--output', default='-',
+                    help='Output file, "-" for stdout (default)'),
+        make_option('--chunk-size', type='int', default=1000,
+                    help='Number of rows read at once'),
+    )
+
+    def handle(self, name=None, **options):
+        if name not in EXPORTS:
+            raise CommandError('Export "users" or "profiles"')
+
+        output = open(options['output'], 'wb') if options['output'] != '-' else sys.stdout
+
+        try:
+            for chunk in export(name, options['format'], options['gzip'], options['chunk_size']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
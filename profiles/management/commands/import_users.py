@@ -0,0 +1,218 @@
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+from operator import or_
+from multiprocessing import Pool, cpu_count
+from optparse import make_option
+
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import models, transaction
+from django.db.models import Q
+
+from profiles.models import MedicalProfile, User
+from profiles.statistics import profiles_created
+
+USER_FIELDS = ('account_name', 'first_name', 'last_name', 'phone')
+PROFILE_PREFIX = 'profile_'  # CSV columns of the user's profile
+
+
+def read_csv(stream):
+    """The records of `stream`, None for the invalid rows"""
+    for row in csv.DictReader(stream):
+        if None in row:  # more fields than the header
+            yield None
+            continue
+
+        record = dict((key, value.decode('utf-8')) for key, value in row.iteritems()
+                      if value and not key.startswith(PROFILE_PREFIX))
+
+        profile = dict((key[len(PROFILE_PREFIX):], value.decode('utf-8'))
+                       for key, value in row.iteritems()
+                       if value and key.startswith(PROFILE_PREFIX))
+        if profile:
+            record['profiles'] = [profile]
+
+        yield record
+
+
+def read_jsonl(stream):
+    """The records of `stream`, None for the invalid lines"""
+    for line in stream:
+        if line.strip():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield record if isinstance(record, dict) else None
+
+
+class Command(BaseCommand):
+    args = '<file.csv | file.jsonl | ->'
+    help = ('Import users (and their medical profiles) from CSV or JSON lines. Existing emails '
+            'are skipped, so an interrupted import can be run again, --resume skips the '
+            'records of the batches already committed.\n\n'
+            'Records have an email, optionally a password, account_name, first_name, last_name, '
+            'phone and "profiles" (a list of medical profile fields). In CSV the "profile_" '
+            'prefixed columns are the fields of a single profile.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=('csv', 'jsonl'), default=None,
+                    help='Input format, guessed from the file extension by default'),
+        make_option('--batch-size', type='int', default=1000,
+                    help='Number of records inserted per transaction'),
+        make_option('--processes', type='int', default=None,
+                    help='Number of password hashing processes (default: the number of CPUs)'),
+        make_option('--resume', action='store_true', default=False,
+                    help='Skip the records imported by the previous run (see --state-file)'),
+        make_option('--state-file', default=None,
+                    help='Where the number of imported records is kept (default: <file>.state)'),
+    )
+
+    def handle(self, path=None, **options):
+        if not path:
+            raise CommandError('Missing the input file')
+
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        state_file = options['state_file'] or (path + '.state' if path != '-' else None)
+
+        skip = 0
+        if options['resume']:
+            if not state_file:
+                raise CommandError('--resume needs --state-file when reading stdin')
+            if os.path.exists(state_file):
+                with open(state_file) as f:
+                    skip = int(f.read() or 0)
+
+        stream = sys.stdin if path == '-' else open(path, 'rb')
+        records = islice(read_csv(stream) if fmt == 'csv' else read_jsonl(stream), skip, None)
+
+        self.pool = Pool(options['processes'] or cpu_count())
+        self.boolean_fields = [field.name for field in MedicalProfile._meta.fields
+                               if isinstance(field, models.BooleanField)]
+        self.counts = dict.fromkeys(('created', 'profiles', 'existing', 'invalid'), 0)
+
+        processed = skip
+        start = time.time()
+
+        try:
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+
+                self.import_batch(batch)
+                processed += len(batch)
+
+                if state_file:
+                    with open(state_file, 'w') as f:
+                        f.write(str(processed))
+
+                elapsed = time.time() - start
+                self.stdout.write(
+                    '{:,} records processed, {created:,} users created, {existing:,} existing, '
+                    '{invalid:,} invalid, {:,.0f} records/sec'.format(
+                        processed, (processed - skip) / elapsed, **self.counts))
+        finally:
+            self.pool.close()
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stdout.write('Done: {created:,} users and {profiles:,} profiles created in {:.2f}s'
+                          .format(time.time() - start, **self.counts))
+
+    def clean_batch(self, batch):
+        """Returns {normalized email: (record, profiles)} of the new users"""
+        records = {}
+
+        for record in batch:
+            if record is None:
+                self.stderr.write('Invalid record: not an object, or more fields than the header')
+                self.counts['invalid'] += 1
+                continue
+
+            email = (record.get('email') or '').strip().lower()  # like UserSerializer
+
+            try:
+                validate_email(email)
+                profiles = [self.make_profile(data) for data in record.get('profiles') or ()]
+            except ValidationError as exc:
+                self.stderr.write('Invalid record {!r}: {}'.format(email, '; '.join(exc.messages)))
+                self.counts['invalid'] += 1
+                continue
+
+            if email in records:
+                self.counts['existing'] += 1
+                continue
+
+            records[email] = (record, profiles)
+
+        if not records:
+            return records
+
+        # Emails stored before they were lowercased can differ in case
+        existing = User.objects.filter(reduce(or_, (Q(email__iexact=email) for email in records)))
+        for email in set(email.lower() for email in existing.values_list('email', flat=True)):
+            del records[email]
+            self.counts['existing'] += 1
+
+        return records
+
+    def make_profile(self, data):
+        """The MedicalProfile of `data`, raises ValidationError for invalid values"""
+        profile = MedicalProfile()
+        values = dict.fromkeys(self.boolean_fields, False)
+        values.update(data)
+
+        for name, value in values.iteritems():
+            try:
+                field = MedicalProfile._meta.get_field(name)
+            except models.FieldDoesNotExist:
+                continue
+
+            if not field.editable or field.primary_key or name == 'user':
+                continue
+
+            if name in self.boolean_fields and isinstance(value, basestring):
+                value = value.strip().lower() in ('1', 't', 'true', 'y', 'yes')
+
+            setattr(profile, field.attname, field.to_python(value))
+
+        return profile
+
+    def import_batch(self, batch):
+        records = self.clean_batch(batch)
+        if not records:
+            return
+
+        emails = records.keys()
+        passwords = self.pool.map(make_password, [records[email][0].get('password') or None
+                                                  for email in emails])
+
+        users = [User(email=email, password=password,
+                      **dict((name, records[email][0][name]) for name in USER_FIELDS
+                             if records[email][0].get(name)))
+                 for email, password in zip(emails, passwords)]
+
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+
+            # bulk_create doesn't set the primary keys
+            pks = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+
+            profiles = []
+            for email in emails:
+                for profile in records[email][1]:
+                    profile.user_id = pks[email]
+                    profiles.append(profile)
+
+            MedicalProfile.objects.bulk_create(profiles)
+            profiles_created(profiles)  # bulk_create doesn't send post_save
+
+        self.counts['created'] += len(users)
+        self.counts['profiles'] += len(profiles)
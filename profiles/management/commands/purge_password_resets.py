@@ -0,0 +1,20 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from profiles.models import PasswordResetRequest
+
+
+class Command(BaseCommand):
+    help = 'Delete the password reset requests older than PASSWORD_RESET_TTL, in chunks'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=1000,
+                    help='Number of rows deleted at once'),
+        make_option('--sleep', type='float', default=0,
+                    help='Seconds to wait between chunks'),
+    )
+
+    def handle(self, *args, **options):
+        deleted = PasswordResetRequest.objects.purge_expired(options['chunk_size'], options['sleep'])
+        self.stdout.write('Deleted {} expired password reset requests'.format(deleted))
@@ -0,0 +1,53 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from profiles.models import ProfileStatistic
+from profiles.statistics import apply_deltas, count_profiles
+
+
+class Command(BaseCommand):
+    help = ('Recount the profile statistics from the profiles and report the counts that '
+            'differ from the summary table. With --write the differences are applied: the '
+            'summary rows are locked for the whole recount, so profile writes wait for it.')
+
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', default=1000,
+                    help='Number of profiles read at once'),
+        make_option('--write', action='store_true', dest='write', default=False,
+                    help='Apply the differences to the summary table'),
+        make_option('--dry-run', action='store_false', dest='write',
+                    help="Only report the differences, don't write anything (default)"),
+    )
+
+    def handle(self, *args, **options):
+        start = time.time()
+
+        with transaction.atomic():
+            stored = ProfileStatistic.objects.all()
+            if options['write']:
+                # The profile writes apply their deltas in their own transaction (see
+                # MedicalProfile.save()), so they're either counted here or wait for the lock
+                stored = stored.select_for_update()
+
+            stored = dict(((dimension, value), count) for dimension, value, count in
+                          stored.values_list('dimension', 'value', 'count'))
+            counts = count_profiles(options['chunk_size'])
+
+            differences = sorted(key for key in set(counts) | set(stored)
+                                 if counts.get(key, 0) != stored.get(key, 0))
+
+            for dimension, value in differences:
+                self.stdout.write('{}={}: {} stored, {} counted'.format(
+                    dimension, value, stored.get((dimension, value), 0),
+                    counts.get((dimension, value), 0)))
+
+            if differences and options['write']:
+                # As deltas, rows created meanwhile (not locked) keep their concurrent updates
+                apply_deltas(dict((key, counts.get(key, 0) - stored.get(key, 0))
+                                  for key in differences))
+
+        self.stdout.write('{} differences in {:.2f}s{}'.format(
+            len(differences), time.time() - start, '' if options['write'] else ' (not written)'))
@@ -0,0 +1,29 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from profiles.mail import send_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Send the queued emails (profiles.mail), once or continuously with --loop'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=None,
+                    help='Number of messages claimed and sent at once (MAIL_BATCH_SIZE)'),
+        make_option('--loop', action='store_true', default=False,
+                    help='Keep running, polling the queue'),
+        make_option('--interval', type='float', default=5,
+                    help='Seconds between polls with --loop'),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_queued_mail(options['batch_size'])
+            if sent or not options['loop']:
+                self.stdout.write('Sent {} messages'.format(sent))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -1,8 +1,43 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import AnonymousUser
+from django.utils.functional import SimpleLazyObject
+
+from .cache import get_cached_user
+
+
+def get_session_user(request):
+    """
+    Like django.contrib.auth.get_user(), but the user is read from the
+    per-user cache instead of the database.
+    """
+    try:
+        user_id = request.session[SESSION_KEY]
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+
+    return get_cached_user(user_id) or AnonymousUser()
+
+
+class CachedAuthenticationMiddleware(object):
+    """
+    Replacement for django's AuthenticationMiddleware.
+
+    request.user is resolved lazily from the per-user cache (profiles.cache).
+    """
+    def process_request(self, request):
+        request.user = SimpleLazyObject(lambda: get_session_user(request))
+
+
 class CustomMiddleware(object):
     """
     Custom middleware for project
 
-    * Set last IP and last_activity.
+    * Set last IP and last_activity (buffered, see profiles.activity).
     """
     def process_request(self, request):
         if 'HTTP_X_REAL_IP' in request.META:
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'User'
+        db.create_table(u'profiles_user', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('password', self.gf('django.db.models.fields.CharField')(max_length=128)),
+            ('last_login', self.gf('django.db.models.fields.DateTimeField')(default=datetime.datetime.now)),
+            ('email', self.gf('django.db.models.fields.EmailField')(unique=True, max_length=75)),
+            ('is_staff', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('is_superuser', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('first_name', self.gf('django.db.models.fields.CharField')(max_length=30, blank=True)),
+            ('last_name', self.gf('django.db.models.fields.CharField')(max_length=30, blank=True)),
+            ('account_name', self.gf('django.db.models.fields.CharField')(max_length=30)),
+            ('phone', self.gf('django.db.models.fields.CharField')(max_length=16, blank=True)),
+            ('registration_ip', self.gf('django.db.models.fields.IPAddressField')(max_length=15, null=True, blank=True)),
+            ('last_ip', self.gf('django.db.models.fields.IPAddressField')(max_length=15, null=True, blank=True)),
+            ('last_activity', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+            ('timezone', self.gf('timezone_field.fields.TimeZoneField')(null=True)),
+            ('image', self.gf('django.db.models.fields.files.ImageField')(max_length=100, null=True, blank=True)),
+            ('show_welcome_dialog', self.gf('django.db.models.fields.BooleanField')(default=True)),
+        ))
+        db.send_create_signal(u'profiles', ['User'])
+
+        # Adding model 'MedicalProfile'
+        db.create_table(u'profiles_medicalprofile', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('created', self.gf('model_utils.fields.AutoCreatedField')(default=datetime.datetime.now)),
+            ('modified', self.gf('model_utils.fields.AutoLastModifiedField')(default=datetime.datetime.now)),
+            ('user', self.gf('django.db.models.fields.related.ForeignKey')(related_name='profiles', to=orm['profiles.User'])),
+            ('name', self.gf('django.db.models.fields.CharField')(max_length=25, null=True, blank=True)),
+            ('age', self.gf('django.db.models.fields.IntegerField')(max_length=3, null=True, blank=True)),
+            ('average_us_nutrition', self.gf('django.db.models.fields.BooleanField')()),
+            ('coffee_cups', self.gf('django.db.models.fields.BooleanField')()),
+            ('contraceptives', self.gf('django.db.models.fields.BooleanField')()),
+            ('fluoride_enrich', self.gf('django.db.models.fields.BooleanField')()),
+            ('health_goals', self.gf('django.db.models.fields.BooleanField')()),
+            ('health_goals_text', self.gf('django.db.models.fields.CharField')(max_length=255, blank=True)),
+            ('lactation', self.gf('django.db.models.fields.BooleanField')()),
+            ('low_sodium_diet', self.gf('django.db.models.fields.BooleanField')()),
+            ('malabsorption', self.gf('django.db.models.fields.BooleanField')()),
+            ('male', self.gf('django.db.models.fields.BooleanField')()),
+            ('medicines_text', self.gf('django.db.models.fields.CharField')(max_length=150, blank=True)),
+            ('medicines', self.gf('django.db.models.fields.BooleanField')()),
+            ('melanin', self.gf('django.db.models.fields.IntegerField')(max_length=2, null=True, blank=True)),
+            ('pregnancy', self.gf('django.db.models.fields.BooleanField')()),
+            ('rda', self.gf('django.db.models.fields.BooleanField')(default=False)),
+            ('smoker', self.gf('django.db.models.fields.BooleanField')()),
+            ('sunlight', self.gf('django.db.models.fields.BooleanField')()),
+            ('vegetarian', self.gf('django.db.models.fields.BooleanField')()),
+            ('birthday', self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True)),
+        ))
+        db.send_create_signal(u'profiles', ['MedicalProfile'])
+
+        # Adding model 'PasswordResetRequest'
+        db.create_table(u'profiles_passwordresetrequest', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('created', self.gf('model_utils.fields.AutoCreatedField')(default=datetime.datetime.now)),
+            ('modified', self.gf('model_utils.fields.AutoLastModifiedField')(default=datetime.datetime.now)),
+            ('user', self.gf('django.db.models.fields.related.OneToOneField')(to=orm['profiles.User'], unique=True)),
+            ('hash', self.gf('django.db.models.fields.CharField')(default='693f864110b09f707e52424f09ecb7397c47ede7', max_length=40)),
+        ))
+        db.send_create_signal(u'profiles', ['PasswordResetRequest'])
+
+
+    def backwards(self, orm):
+        # Deleting model 'User'
+        db.delete_table(u'profiles_user')
+
+        # Deleting model 'MedicalProfile'
+        db.delete_table(u'profiles_medicalprofile')
+
+        # Deleting model 'PasswordResetRequest'
+        db.delete_table(u'profiles_passwordresetrequest')
+
+
+    models = {
+        u'profiles.medicalprofile': {
+            'Meta': {'object_name': 'MedicalProfile'},
+            'age': ('django.db.models.fields.IntegerField', [], {'max_length': '3', 'null': 'True', 'blank': 'True'}),
+            'average_us_nutrition': ('django.db.models.fields.BooleanField', [], {}),
+            'birthday': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'coffee_cups': ('django.db.models.fields.BooleanField', [], {}),
+            'contraceptives': ('django.db.models.fields.BooleanField', [], {}),
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'fluoride_enrich': ('django.db.models.fields.BooleanField', [], {}),
+            'health_goals': ('django.db.models.fields.BooleanField', [], {}),
+            'health_goals_text': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lactation': ('django.db.models.fields.BooleanField', [], {}),
+            'low_sodium_diet': ('django.db.models.fields.BooleanField', [], {}),
+            'malabsorption': ('django.db.models.fields.BooleanField', [], {}),
+            'male': ('django.db.models.fields.BooleanField', [], {}),
+            'medicines': ('django.db.models.fields.BooleanField', [], {}),
+            'medicines_text': ('django.db.models.fields.CharField', [], {'max_length': '150', 'blank': 'True'}),
+            'melanin': ('django.db.models.fields.IntegerField', [], {'max_length': '2', 'null': 'True', 'blank': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '25', 'null': 'True', 'blank': 'True'}),
+            'pregnancy': ('django.db.models.fields.BooleanField', [], {}),
+            'rda': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'smoker': ('django.db.models.fields.BooleanField', [], {}),
+            'sunlight': ('django.db.models.fields.BooleanField', [], {}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'profiles'", 'to': u"orm['profiles.User']"}),
+            'vegetarian': ('django.db.models.fields.BooleanField', [], {})
+        },
+        u'profiles.passwordresetrequest': {
+            'Meta': {'object_name': 'PasswordResetRequest'},
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'hash': ('django.db.models.fields.CharField', [], {'default': "'4abf8703a35acec5d1e4a6f2cbab394764be4efb'", 'max_length': '40'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'user': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['profiles.User']", 'unique': 'True'})
+        },
+        u'profiles.user': {
+            'Meta': {'object_name': 'User'},
+            'account_name': ('django.db.models.fields.CharField', [], {'max_length': '30'}),
+            'email': ('django.db.models.fields.EmailField', [], {'unique': 'True', 'max_length': '75'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image': ('django.db.models.fields.files.ImageField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_activity': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'last_ip': ('django.db.models.fields.IPAddressField', [], {'max_length': '15', 'null': 'True', 'blank': 'True'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'phone': ('django.db.models.fields.CharField', [], {'max_length': '16', 'blank': 'True'}),
+            'registration_ip': ('django.db.models.fields.IPAddressField', [], {'max_length': '15', 'null': 'True', 'blank': 'True'}),
+            'show_welcome_dialog': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'timezone': ('timezone_field.fields.TimeZoneField', [], {'null': 'True'})
+        }
+    }
+
+    complete_apps = ['profiles']
\ No newline at end of file
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding index on 'MedicalProfile', fields ['modified', u'id']
+        db.create_index(u'profiles_medicalprofile', ['modified', u'id'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'MedicalProfile', fields ['modified', u'id']
+        db.delete_index(u'profiles_medicalprofile', ['modified', u'id'])
+
+
+    models = {
+        u'profiles.medicalprofile': {
+            'Meta': {'object_name': 'MedicalProfile', 'index_together': "[('modified', 'id')]"},
+            'age': ('django.db.models.fields.IntegerField', [], {'max_length': '3', 'null': 'True', 'blank': 'True'}),
+            'average_us_nutrition': ('django.db.models.fields.BooleanField', [], {}),
+            'birthday': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'coffee_cups': ('django.db.models.fields.BooleanField', [], {}),
+            'contraceptives': ('django.db.models.fields.BooleanField', [], {}),
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'fluoride_enrich': ('django.db.models.fields.BooleanField', [], {}),
+            'health_goals': ('django.db.models.fields.BooleanField', [], {}),
+            'health_goals_text': ('django.db.models.fields.CharField', [], {'max_length': '255', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'lactation': ('django.db.models.fields.BooleanField', [], {}),
+            'low_sodium_diet': ('django.db.models.fields.BooleanField', [], {}),
+            'malabsorption': ('django.db.models.fields.BooleanField', [], {}),
+            'male': ('django.db.models.fields.BooleanField', [], {}),
+            'medicines': ('django.db.models.fields.BooleanField', [], {}),
+            'medicines_text': ('django.db.models.fields.CharField', [], {'max_length': '150', 'blank': 'True'}),
+            'melanin': ('django.db.models.fields.IntegerField', [], {'max_length': '2', 'null': 'True', 'blank': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '25', 'null': 'True', 'blank': 'True'}),
+            'pregnancy': ('django.db.models.fields.BooleanField', [], {}),
+            'rda': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'smoker': ('django.db.models.fields.BooleanField', [], {}),
+            'sunlight': ('django.db.models.fields.BooleanField', [], {}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'profiles'", 'to': u"orm['profiles.User']"}),
+            'vegetarian': ('django.db.models.fields.BooleanField', [], {})
+        },
+        u'profiles.passwordresetrequest': {
+            'Meta': {'object_name': 'PasswordResetRequest'},
+            'created': ('model_utils.fields.AutoCreatedField', [], {'default': 'datetime.datetime.now'}),
+            'hash': ('django.db.models.fields.CharField', [], {'default': "'ef3b5838ae024236359c1f87ec2b6cd88633ad32'", 'max_length': '40'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('model_utils.fields.AutoLastModifiedField', [], {'default': 'datetime.datetime.now'}),
+            'user': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['profiles.User']", 'unique': 'True'})
+        },
+        u'profiles.user': {
+            'Meta': {'object_name': 'User'},
+            'account_name': ('django.db.models.fields.CharField', [], {'max_length': '30'}),
+            'email': ('django.db.models.fields.EmailField', [], {'unique': 'True', 'max_length': '75'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'image': ('django.db.models.fields.files.ImageField', [], {'max_length': '100', 'null': 'True', 'blank': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_activity': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'last_ip': ('django.db.models.fields.IPAddressField', [], {'max_length': '15', 'null': 'True', 'blank': 'True'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'phone': ('django.db.models.fields.CharField', [], {'max_length': '16', 'blank': 'True'}),
+            'registration_ip': ('django.db.models.fields.IPAddressField', [], {'max_length': '15', 'null': 'True', 'blank': 'True'}),
+            'show_welcome_dialog': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'timezone': ('timezone_field.fields.TimeZoneField', [], {'null': 'True'}),
+            'token_version': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'})
+        }
+    }
+
+    complete_apps = ['profiles']
\ No newline at end of file
@@ -1,11 +1,13 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
 # from django_countries import CountryField
 
 import logging
-import pygeoip
-import pytz
+import time
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
+from django.db.models.expressions import ExpressionNode
 from django.utils import timezone
 from easy_thumbnails.fields import ThumbnailerImageField
 from timezone_field import TimeZoneField
@@ -13,8 +15,14 @@ from django.utils.translation import ugettext_lazy as _
 from model_utils.models import TimeStampedModel
 # from django_countries import CountryField
 
+from common.bitfield import BitField, BitFieldManager
+from common.geoip import country_timezone, geoip_resolver
+from common.hashers import check_and_rehash
+from common.models import DirtyFieldsMixin
 from common.utils import generate_secure_hash, get_image_upload_path, get_external_url
 
+from .activity import activity_buffer
+
 logger = logging.getLogger('tomigo.users.models')
 
 
@@ -58,7 +66,7 @@ class UserManager(BaseUserManager):
         return user
 
 
-class User(AbstractBaseUser):
+class User(DirtyFieldsMixin, AbstractBaseUser):
     """
     Modified version of AbstractBaseUser
     """
@@ -91,6 +99,12 @@ class User(AbstractBaseUser):
 
     show_welcome_dialog = models.BooleanField(default=True, verbose_name=_('Show welcome dialog?'))
 
+    # Bumped to revoke all the signed tokens issued for the user (profiles.tokens)
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Bumped on every change of the user or his profiles (ETags)
+    version = models.PositiveIntegerField(default=0, editable=False)
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
@@ -103,6 +117,45 @@ class User(AbstractBaseUser):
     # def is_superuser(self):
     #     return super()
 
+    def __eq__(self, other):
+        """
+        Compare by primary key - also for deferred instances (only(), token users),
+        which are of a different class
+        """
+        return isinstance(other, User) and self._get_pk_val() == other._get_pk_val()
+
+    def __hash__(self):
+        return hash(self._get_pk_val())
+
+    def save(self, *args, **kwargs):
+        """Bumps the version, unless nothing is written"""
+        update_fields = kwargs.get('update_fields')
+
+        if update_fields is None:
+            changed = self._state.adding or bool(self.get_dirty_fields())
+        else:
+            changed = bool(update_fields)
+            if changed:
+                kwargs['update_fields'] = list(update_fields) + ['version']
+
+        if changed:
+            if self._state.adding:
+                self.version += 1
+            else:
+                # Incremented by the UPDATE, concurrent saves never get the same version
+                self.version = models.F('version') + 1
+
+        super(User, self).save(*args, **kwargs)
+
+    def _save_table(self, *args, **kwargs):
+        updated = super(User, self)._save_table(*args, **kwargs)
+
+        if isinstance(self.version, ExpressionNode):
+            # Read the new version back before post_save (which caches it)
+            self.version = self.__class__._base_manager.filter(pk=self.pk).values_list(
+                'version', flat=True).get()
+
+        return updated
 
     def get_full_name(self):
         """
@@ -122,42 +175,53 @@ class User(AbstractBaseUser):
         if hasattr(self, 'updated'):
             return  # Avoid updating twice
 
-        self.last_activity = timezone.now()
-        update_fields = ['last_activity']  # premature optimization
-
-        if self.last_ip != request.META['REMOTE_ADDR']:
-            self.last_ip = request.META['REMOTE_ADDR']
-            update_fields.append('last_ip')
+        self.updated = True
+        ip = request.META['REMOTE_ADDR']
 
-        if not self.registration_ip:
-            self.registration_ip = self.last_ip
+        if self.registration_ip:
+            # Regular activity - buffered and written in bulk
+            activity_buffer.record(self, ip)
+            return
 
-            self.set_country_by_ip()
-            self.set_timezone_by_country()
+        # First activity - save right away
+        self.last_activity = timezone.now()
+        self.last_ip = ip
+        self.registration_ip = ip
 
-            update_fields.extend(['registration_ip', 'timezone'])
+        self.set_timezone_by_country(self.set_country_by_ip())
 
-        self.updated = True
-        self.save(update_fields=update_fields)
+        self.save(update_fields=['last_activity', 'last_ip', 'registration_ip', 'timezone'])
 
     def set_country_by_ip(self):
-        geoip = pygeoip.GeoIP(settings.GEOIP_PATH)
-        country = geoip.country_code_by_addr(self.registration_ip)
+        """
+        Returns the country code of the registration ip
+        """
+        country = geoip_resolver.country_code_by_addr(self.registration_ip)
         logger.info('set_country_by_ip(): country: %s', country)
 
         # if country:
         #     self.location.country = country
         #     self.location.save()
+        return country
 
-    def set_timezone_by_country(self):
+    def set_timezone_by_country(self, country):
         """
-        Try guessing the user's timezone by location.country
+        Try guessing the user's timezone by country
         """
+        timezone = country_timezone(country)
+
+        if timezone:
+            self.timezone = timezone
+
+    def check_password(self, raw_password):
+        """Outdated hashes are updated in the background, see common.hashers"""
+        return check_and_rehash(self, raw_password)
+
+    def revoke_tokens(self):
+        """Invalidate all the signed tokens issued for the user"""
+        self.token_version += 1
+        self.save(update_fields=['token_version'])
 
-        # try:
-        #     self.timezone = pytz.country_timezones[self.location.country.code][0]
-        # except (AttributeError, KeyError, IndexError):
-        #     pass
     def has_perm(self, perm, obj=None):
       return self.is_staff
 
@@ -165,7 +229,7 @@ class User(AbstractBaseUser):
       return self.is_staff
 
 
-class MedicalProfile(TimeStampedModel):
+class MedicalProfile(DirtyFieldsMixin, TimeStampedModel):
     class Age:
         YOUNGSTER = 27
         ADULT = 43
@@ -242,18 +306,161 @@ class MedicalProfile(TimeStampedModel):
     vegetarian = models.BooleanField(blank=True, verbose_name=_('vegeterian'))
     birthday = models.DateTimeField(blank=True, null=True, verbose_name=_('birthday'))
 
+    # The boolean fields packed (common.bitfield), for flag filters. New flags go at the end.
+    # Written alongside the boolean columns for now, until these are dropped.
+    flags = BitField(flags=('average_us_nutrition', 'coffee_cups', 'contraceptives',
+                            'fluoride_enrich', 'health_goals', 'lactation', 'low_sodium_diet',
+                            'malabsorption', 'male', 'medicines', 'pregnancy', 'rda', 'smoker',
+                            'sunlight', 'vegetarian'))
+
+    # QuerySet.update() sends no signals: updates of the counted fields (age, melanin,
+    # flags) have to apply the statistics deltas themselves (profiles.statistics)
+    objects = BitFieldManager()
+
+    def save(self, *args, **kwargs):
+        # The statistics deltas (post_save) are applied in the transaction of the write,
+        # so the rebuild_profile_statistics command never counts a profile twice
+        with transaction.atomic(savepoint=False):
+            super(MedicalProfile, self).save(*args, **kwargs)
+
     class Meta:
         verbose_name = _('Medical profile')
         verbose_name_plural = _('Medical profiles')
+        index_together = [('modified', 'id')]  # cursor pagination
         def __unicode__(self):
             return ("{profile}: {name}").format(profile=_("profile"),
                                                 name=self.name)
 
 
 
+class ProfileStatistic(models.Model):
+    """
+    Number of profiles per (dimension, value), e.g. ("age", "43") or
+    ("flag", "smoker"), maintained by profiles.statistics
+    """
+    dimension = models.CharField(max_length=20)
+    value = models.CharField(max_length=40)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('dimension', 'value')]
+
+    def __unicode__(self):
+        return u'{0.dimension}={0.value}: {0.count}'.format(self)
+
+
+class PasswordResetRequestManager(models.Manager):
+    def get_cutoff(self):
+        return timezone.now() - timedelta(seconds=getattr(settings, 'PASSWORD_RESET_TTL', 24 * 60 * 60))
+
+    def valid(self):
+        """The requests issued within PASSWORD_RESET_TTL"""
+        return self.filter(created__gte=self.get_cutoff())
+
+    def expired(self):
+        return self.filter(created__lt=self.get_cutoff())
+
+    def issue(self, user):
+        """
+        Issue a new hash for `user`, replacing the previous one, with a single
+        INSERT ... ON DUPLICATE KEY UPDATE on MySQL (UPDATE, then INSERT if
+        there was nothing to update, elsewhere). Returns the hash.
+        """
+        hash_, now = generate_secure_hash(), timezone.now()
+        connection = connections[self.db]
+
+        if connection.vendor == 'mysql':
+            opts = self.model._meta
+            qn = connection.ops.quote_name
+            columns = [opts.get_field(name).column for name in ('user', 'hash', 'created', 'modified')]
+
+            connection.cursor().execute(
+                'INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s) '
+                'ON DUPLICATE KEY UPDATE {updates}'.format(
+                    table=qn(opts.db_table),
+                    columns=', '.join(qn(column) for column in columns),
+                    updates=', '.join('{0} = VALUES({0})'.format(qn(column))
+                                      for column in columns[1:])),
+                [user.pk, hash_, now, now])
+            return hash_
+
+        updates = {'hash': hash_, 'created': now, 'modified': now}
+
+        if not self.filter(user=user).update(**updates):
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(user=user, **updates)
+            except IntegrityError:
+                self.filter(user=user).update(**updates)  # issued concurrently
+
+        return hash_
+
+    def purge_expired(self, chunk_size=1000, sleep=0):
+        """
+        Delete the expired requests, at most `chunk_size` rows per statement,
+        in primary key order. Each chunk is its own transaction, so only the
+        deleted rows are locked, and for a short time.
+        Returns the number of deleted rows.
+        """
+        queryset = self.expired().order_by('pk')
+        last_pk = deleted = 0
+
+        while True:
+            pks = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return deleted
+
+            last_pk = pks[-1]
+            self.filter(pk__in=pks).delete()
+            deleted += len(pks)
+
+            if sleep:
+                time.sleep(sleep)
+
+
 class PasswordResetRequest(TimeStampedModel):
     user = models.OneToOneField(User)
-    hash = models.CharField(max_length=40, default=generate_secure_hash)
+    hash = models.CharField(max_length=40, default=generate_secure_hash, unique=True)
+
+    objects = PasswordResetRequestManager()
 
     def external_url(self):
         return get_external_url(self)
+
+
+class QueuedEmail(TimeStampedModel):
+    """
+    Outbox entry, sent by the send_queued_mail command (profiles.mail)
+    """
+    class Status:
+        QUEUED = 0
+        SENT = 1
+        FAILED = 2
+
+        CHOICES = (
+            (QUEUED, 'Queued'),
+            (SENT, 'Sent'),
+            (FAILED, 'Failed'),
+        )
+
+    from_email = models.CharField(max_length=254)
+    recipients = models.TextField()  # one address per line
+    subject = models.TextField()
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+
+    status = models.PositiveSmallIntegerField(choices=Status.CHOICES, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    sent = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        index_together = [('status', 'next_attempt')]  # the queue
+
+    def __unicode__(self):
+        return u'{0.subject} ({0.recipients})'.format(self)
+
+
+# At bottom to avoid circular import
+import signals  # noqa
@@ -5,10 +5,11 @@ from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
 from common.fields import ImageURLField, CroppedImageURLField
-from common.serializers import CustomSerializer, CustomModelSerializer
+from common.serializers import CompiledSerializerMixin, CustomSerializer, CustomModelSerializer
 
 
 from .models import User, PasswordResetRequest, MedicalProfile
+from .tokens import REFRESH, InvalidToken, parse_token
 
 
 def validate_password(password):
@@ -21,6 +22,7 @@ def validate_password(password):
 class MedicalProfileSerializer(CustomModelSerializer):
     class Meta:
         model = MedicalProfile
+        compiled = True
 
         fields = ('id', 'user', 'name', 'age', 'average_us_nutrition', 'coffee_cups',
                   'contraceptives', 'fluoride_enrich', 'health_goals',
@@ -35,7 +37,7 @@ class MedicalProfileSerializer(CustomModelSerializer):
             return obj
 
 
-class MedicalProfileNestedSerializer(serializers.ModelSerializer):
+class MedicalProfileNestedSerializer(CompiledSerializerMixin, serializers.ModelSerializer):
     def _youngster(self, obj):
         return obj.age == 27
 
@@ -57,6 +59,7 @@ class MedicalProfileNestedSerializer(serializers.ModelSerializer):
                   'malabsorption', 'male', 'medicines', 'medicines_text',
                   'melanin', 'pregnancy', 'rda', 'smoker', 'sunlight',
                   'vegetarian', 'birthday', 'youngster', 'adult', 'elder',)
+        compiled = True
 
 
 # post only
@@ -66,6 +69,7 @@ class UserSerializer(CustomModelSerializer):
         fields = ('id', 'email', 'account_name',
                   'last_ip', 'registration_ip', 'show_welcome_dialog',
                   'image', 'image_crop_mini', 'image_crop_100', 'profiles')
+        compiled = True
 
         read_only_fields = ('is_staff', 'last_ip',
                             'registration_ip',)
@@ -174,6 +178,23 @@ class AuthenticationSerializer(CustomSerializer):
         return attrs
 
 
+class TokenRefreshSerializer(CustomSerializer):
+    refresh_token = serializers.CharField(required=True)
+
+    def validate_refresh_token(self, attrs, source):
+        try:
+            claims = parse_token(attrs.get(source, ''), REFRESH)
+            user = User.objects.get(pk=claims['user_id'])
+        except (InvalidToken, User.DoesNotExist):
+            raise ValidationError(_('Invalid or expired refresh token.'))
+
+        if user.token_version != claims['version'] or not user.is_active:
+            raise ValidationError(_('Invalid or expired refresh token.'))
+
+        self.user = user
+        return attrs
+
+
 class PasswordResetSerializer(CustomSerializer):
     email = serializers.EmailField(required=True)
 
@@ -195,7 +216,7 @@ class PasswordResetCompleteSerializer(CustomSerializer):
     def validate_hash(self, attrs, source):
         hash_ = attrs.get(source, '')
         try:
-            prp = PasswordResetRequest.objects.get(hash=hash_)
+            prp = PasswordResetRequest.objects.valid().select_related('user').get(hash=hash_)
             self._user = prp.user  # Cache for using in view later
         except PasswordResetRequest.DoesNotExist:
             raise ValidationError(_('Invalid password reset hash'))
@@ -0,0 +1,65 @@
+from django.db.models.signals import post_delete, post_save
+
+from common.hashers import password_rehashed
+from common.thumbnails import manifest_updated
+
+from . import statistics
+from .cache import bump_row_version, invalidate_user, set_row_version
+from .models import MedicalProfile, User
+
+
+# The user receivers are connected without a sender and check the instance:
+# users loaded from tokens are deferred User subclasses (profiles.tokens),
+# saved with that class as the sender.
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the cached user object when it's changed (incl. password changes)"""
+    if isinstance(instance, User):
+        invalidate_user(instance.pk)
+
+
+def invalidate_rehashed_user(sender, pk, **kwargs):
+    """The cached user object holds the password hash"""
+    invalidate_user(pk)
+
+
+def update_row_version(sender, instance, **kwargs):
+    if isinstance(instance, User):
+        set_row_version(instance.pk, instance.version)
+
+
+def bump_user_version(sender, instance, **kwargs):
+    """The profiles are serialized with the user"""
+    bump_row_version(instance.user_id)
+
+
+def count_saved_profile(sender, instance, created, **kwargs):
+    statistics.profile_saved(instance, created)
+
+
+def count_deleted_profile(sender, instance, **kwargs):
+    statistics.profile_deleted(instance)
+
+
+def bump_version_on_manifest(sender, instance, **kwargs):
+    """The thumbnail URLs of the user changed"""
+    if isinstance(instance, User) and instance.pk:
+        bump_row_version(instance.pk)
+
+
+post_save.connect(invalidate_cached_user, dispatch_uid='profiles.signals.user_saved')
+post_delete.connect(invalidate_cached_user, dispatch_uid='profiles.signals.user_deleted')
+
+password_rehashed.connect(invalidate_rehashed_user, sender=User,
+                          dispatch_uid='profiles.signals.user_rehashed')
+
+post_save.connect(update_row_version, dispatch_uid='profiles.signals.user_version')
+post_save.connect(bump_user_version, sender=MedicalProfile,
+                  dispatch_uid='profiles.signals.profile_saved')
+post_delete.connect(bump_user_version, sender=MedicalProfile,
+                    dispatch_uid='profiles.signals.profile_deleted')
+post_save.connect(count_saved_profile, sender=MedicalProfile,
+                  dispatch_uid='profiles.signals.profile_statistics_saved')
+post_delete.connect(count_deleted_profile, sender=MedicalProfile,
+                    dispatch_uid='profiles.signals.profile_statistics_deleted')
+manifest_updated.connect(bump_version_on_manifest, dispatch_uid='profiles.signals.user_thumbnails')
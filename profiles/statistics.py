@@ -0,0 +1,126 @@
+"""
+Profile counts by age, melanin and health flag.
+
+The ProfileStatistic rows are updated with deltas when a profile is created,
+changed or deleted (profiles.signals), so reading them doesn't depend on
+the number of profiles. Writes that bypass the signals have to call
+apply_deltas() themselves (profiles_created() after bulk_create()), and so
+does MedicalProfile QuerySet.update() of age, melanin or a flag - it keeps
+the packed flags in sync (common.bitfield), not the counts. The
+rebuild_profile_statistics command recomputes the counts from scratch.
+"""
+
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import MedicalProfile, ProfileStatistic
+
+TOTAL = 'total'
+DIMENSIONS = ('age', 'melanin')  # counted per value
+FLAGS = MedicalProfile._meta.get_field('flags').flags  # counted when set
+
+NONE = 'none'  # the value of unset (NULL) dimensions
+
+
+def get_keys(values):
+    """The (dimension, value) keys a profile counts for, `values` by attname"""
+    keys = [(TOTAL, '')]
+
+    for dimension in DIMENSIONS:
+        value = values.get(dimension)
+        keys.append((dimension, NONE if value is None else unicode(value)))
+
+    keys.extend(('flag', flag) for flag in FLAGS if values.get(flag))
+    return keys
+
+
+def get_profile_keys(profile, original=False):
+    """
+    The keys of `profile`, or of its state when it was loaded (see
+    DirtyFieldsMixin) if `original`
+    """
+    values = dict((name, getattr(profile, name)) for name in DIMENSIONS + FLAGS)
+    if original:
+        values.update((name, value) for name, value in profile._original_state.iteritems()
+                       if name in values)
+    return get_keys(values)
+
+
+def get_deltas(old_keys, new_keys):
+    deltas = Counter(new_keys)
+    deltas.subtract(Counter(old_keys))
+    return dict((key, delta) for key, delta in deltas.iteritems() if delta)
+
+
+def apply_deltas(deltas):
+    """Add {(dimension, value): delta} to the counts"""
+    with transaction.atomic():
+        for (dimension, value), delta in sorted(deltas.iteritems()):  # lock in the same order
+            statistics = ProfileStatistic.objects.filter(dimension=dimension, value=value)
+
+            if statistics.update(count=F('count') + delta):
+                continue
+
+            try:
+                with transaction.atomic():
+                    ProfileStatistic.objects.create(dimension=dimension, value=value, count=delta)
+            except IntegrityError:
+                statistics.update(count=F('count') + delta)  # created concurrently
+
+
+def profile_saved(profile, created):
+    old_keys = [] if created else get_profile_keys(profile, original=True)
+    deltas = get_deltas(old_keys, get_profile_keys(profile))
+
+    if deltas:
+        apply_deltas(deltas)
+
+
+def profile_deleted(profile):
+    apply_deltas(get_deltas(get_profile_keys(profile, original=True), []))
+
+
+def profiles_created(profiles):
+    """For profiles created without signals (bulk_create)"""
+    deltas = Counter()
+    for profile in profiles:
+        deltas.update(get_profile_keys(profile))
+
+    if deltas:
+        apply_deltas(deltas)
+
+
+def count_profiles(chunk_size=1000):
+    """Count all the profiles from scratch, in primary key chunks"""
+    counts = Counter()
+    fields = ('id', ) + DIMENSIONS + FLAGS
+    queryset = MedicalProfile.objects.order_by('pk').values(*fields)
+    last_pk = 0
+
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not rows:
+            return counts
+
+        for row in rows:
+            counts.update(get_keys(row))
+
+        last_pk = rows[-1]['id']
+
+
+def get_statistics():
+    """{"total": count, dimension: {value: count}, "flag": {flag: count}}"""
+    statistics = {TOTAL: 0}
+    for dimension in DIMENSIONS + ('flag', ):
+        statistics[dimension] = {}
+
+    for dimension, value, count in ProfileStatistic.objects.values_list('dimension', 'value',
+                                                                        'count'):
+        if dimension == TOTAL:
+            statistics[TOTAL] = count
+        elif count:
+            statistics.setdefault(dimension, {})[value] = count
+
+    return statistics
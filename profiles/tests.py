@@ -1,10 +1,37 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+from datetime import timedelta
+from StringIO import StringIO
+
 from django.contrib import admin
 from django.contrib.admin.sites import AdminSite
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection, models
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+import msgpack
+
+from common.hashers import stats as hasher_stats
+from common.thumbnails import _get_key, update_manifest
 
+from .activity import ActivityBuffer
 from .admin import UserCreationForm, UserAdmin
-from .models import User
+from .cache import get_cached_user, get_row_version
+from .mail import get_retry_delay, queue_mail, send_queued_mail
+from .models import MedicalProfile, PasswordResetRequest, ProfileStatistic, QueuedEmail, User
 from .serializers import UserSerializer
+from .statistics import get_statistics
+from .tokens import ACCESS, REFRESH, InvalidToken, make_token, parse_token
 
 
 class UserTestCase(TestCase):
@@ -37,20 +64,1086 @@ class UserTestCase(TestCase):
         user = User.objects.create(email='test@example.com')
 
         user.registration_ip = '37.26.147.250'
-        user.set_country_by_ip()
 
-        self.assertEquals(user.location.country, 'IL')
-        self.assertEquals(user.location.country.name, 'Israel')
+        self.assertEquals(user.set_country_by_ip(), 'IL')
 
     def test_guessing_timezone(self):
         user = User.objects.create(email='test@example.com')
 
-        user.location.country = 'IL'
-        user.location.save()
+        user.set_timezone_by_country('IL')
+        self.assertEquals(str(user.timezone), 'Asia/Jerusalem')
 
-        user.set_timezone_by_country()
+        user.set_timezone_by_country(None)
         self.assertEquals(str(user.timezone), 'Asia/Jerusalem')
 
+    def test_backfill_geo_command(self):
+        User.objects.create(email='test@example.com', registration_ip='37.26.147.250')
+        User.objects.create(email='test2@example.com', registration_ip='127.0.0.1')
+        User.objects.create(email='test3@example.com')
+
+        call_command('backfill_geo', chunk_size=1, stdout=StringIO())
+
+        timezones = dict(User.objects.values_list('email', 'timezone'))
+        self.assertEquals(str(timezones['test@example.com']), 'Asia/Jerusalem')
+        self.assertEquals(timezones['test2@example.com'], None)
+        self.assertEquals(timezones['test3@example.com'], None)
+
+
+class ActivityBufferTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com',
+                                        registration_ip='10.0.0.1')
+        self.buffer = ActivityBuffer(flush_interval=3600, flush_threshold=2,
+                                     granularity=60)
+
+    def test_record_is_buffered(self):
+        self.assertTrue(self.buffer.record(self.user, '10.0.0.2'))
+
+        self.assertEquals(self.user.last_ip, '10.0.0.2')
+        self.assertEquals(User.objects.get().last_ip, None)
+        self.assertEquals(self.buffer.get_stats()['pending'], 1)
+
+    def test_skip_below_granularity(self):
+        now = timezone.now()
+        self.buffer.record(self.user, '10.0.0.2', now=now)
+
+        self.assertFalse(self.buffer.record(self.user, '10.0.0.2',
+                                            now=now + timedelta(seconds=10)))
+        self.assertTrue(self.buffer.record(self.user, '10.0.0.3',
+                                           now=now + timedelta(seconds=10)))
+        self.assertTrue(self.buffer.record(self.user, '10.0.0.3',
+                                           now=now + timedelta(seconds=70)))
+        self.assertEquals(self.buffer.stats.get('skipped'), 1)
+
+    def test_flush_on_threshold(self):
+        user2 = User.objects.create(email='test2@example.com')
+
+        self.buffer.record(self.user, '10.0.0.2')
+        self.buffer.record(user2, '10.0.0.3')
+
+        stats = self.buffer.get_stats()
+        self.assertEquals(stats['pending'], 0)
+        self.assertEquals(stats['flushes'], 1)
+        self.assertEquals(stats['flushed_rows'], 2)
+        self.assertEquals(User.objects.get(pk=self.user.pk).last_ip, '10.0.0.2')
+        self.assertEquals(User.objects.get(pk=user2.pk).last_ip, '10.0.0.3')
+
+    def test_skip_after_flush_with_stale_user(self):
+        stale = User.objects.get(pk=self.user.pk)  # e.g. from the user cache
+
+        self.buffer.record(self.user, '10.0.0.2')
+        self.buffer.flush()
+
+        self.assertFalse(self.buffer.record(stale, '10.0.0.2'))
+
+    def test_update_from_request_uses_buffer(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.2')
+
+        with self.assertNumQueries(0):
+            self.user.update_from_request(request)
+
+        self.assertEquals(self.user.last_ip, '10.0.0.2')
+
+
+def create_profile(user, **kwargs):
+    # The boolean fields have no defaults
+    for field in MedicalProfile._meta.fields:
+        if isinstance(field, models.BooleanField):
+            kwargs.setdefault(field.name, False)
+
+    return MedicalProfile.objects.create(user=user, **kwargs)
+
+
+class DirtyFieldsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        registration_ip='127.0.0.1')
+
+    def test_dirty_fields(self):
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEquals(user.get_dirty_fields(), set())
+
+        user.last_ip = '10.0.0.1'
+        user.image = 'images/test.png'
+        self.assertEquals(user.get_dirty_fields(), set(['last_ip', 'image']))
+        self.assertTrue(user.has_changed('image'))
+
+        user.save()
+        self.assertEquals(user.get_dirty_fields(), set())
+
+    def test_save_writes_changed_fields_only(self):
+        user = User.objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(0):
+            user.save()
+
+        user.last_ip = '10.0.0.1'
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+
+        sql = queries[0]['sql']
+        self.assertIn('"last_ip"', sql)
+        self.assertNotIn('"email"', sql)
+        self.assertEquals(User.objects.get(pk=user.pk).last_ip, '10.0.0.1')
+
+    def test_partial_save_keeps_other_changes_dirty(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.last_ip = '10.0.0.1'
+        user.first_name = 'first'
+
+        user.save(update_fields=['last_ip'])
+        self.assertEquals(user.get_dirty_fields(), set(['first_name']))
+
+        user.save()
+        self.assertEquals(User.objects.get(pk=user.pk).first_name, 'first')
+
+    def test_modified_is_updated(self):
+        profile = create_profile(self.user, name='test')
+        modified = profile.modified
+
+        profile = MedicalProfile.objects.get(pk=profile.pk)
+        profile.smoker = True
+        profile.save()
+
+        profile = MedicalProfile.objects.get(pk=profile.pk)
+        self.assertTrue(profile.smoker)
+        self.assertTrue(profile.modified > modified)
+
+
+class CursorPaginationTestCase(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create(email='staff@example.com', account_name='staff',
+                                         registration_ip='127.0.0.1', is_staff=True)
+        self.staff.set_password('test')
+        self.staff.save()
+
+        for i in range(4):
+            user = User.objects.create(email='user%d@example.com' % i, account_name='user')
+            create_profile(user)
+
+        self.client.post('/api/login', {'email': 'staff@example.com', 'password': 'test'})
+
+    def get_all_pages(self, url):
+        ids = []
+        while url:
+            res = self.client.get(url)
+            self.assertEquals(res.status_code, 200)
+            self.assertTrue(len(res.data) <= 2)
+
+            ids.extend(item['id'] for item in res.data)
+            url = res.get('Link', '').partition('<')[2].partition('>')[0]
+        return ids
+
+    def test_users(self):
+        ids = self.get_all_pages('/api/users?page_size=2')
+        self.assertEquals(ids, list(User.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_profiles(self):
+        ids = self.get_all_pages('/api/profiles?page_size=2')
+        self.assertEquals(ids, list(MedicalProfile.objects.order_by('modified', 'id')
+                                    .values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        res = self.client.get('/api/users?cursor=invalid')
+        self.assertEquals(res.status_code, 400)
+
+
+class QueryBudgetTestCase(TestCase):
+    """The number of queries of a list request must not grow with the page size"""
+
+    def setUp(self):
+        self.staff = User.objects.create(email='staff@example.com', account_name='staff',
+                                         registration_ip='127.0.0.1', is_staff=True)
+        self.staff.set_password('test')
+        self.staff.save()
+        create_profile(self.staff)
+
+        for i in range(6):
+            user = User.objects.create(email='user%d@example.com' % i, account_name='user',
+                                       image='images/%d.png' % i)
+            create_profile(user)
+            create_profile(user)
+
+        self.client.post('/api/login', {'email': 'staff@example.com', 'password': 'test'})
+        self.client.get('/api/users/me')
+
+    def assertQueryBudget(self, url):
+        counts = {}
+
+        for page_size in (1, 5):
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(url, {'page_size': page_size})
+
+            self.assertEquals(res.status_code, 200)
+            self.assertEquals(len(res.data), page_size)
+            counts[page_size] = [query['sql'] for query in queries]
+
+        self.assertEquals(len(counts[1]), len(counts[5]),
+                          'Queries grow with the page size of {}:\n{}'.format(
+                              url, '\n'.join(counts[5])))
+
+    def test_users_list(self):
+        self.assertQueryBudget('/api/users')
+
+    def test_profiles_list(self):
+        self.assertQueryBudget('/api/profiles')
+
+    def test_retrieve_prefetches_profiles(self):
+        with self.assertNumQueries(2):
+            res = self.client.get('/api/users/me')
+        self.assertEquals(len(res.data['profiles']), 1)
+
+        with self.assertNumQueries(1):
+            self.client.get('/api/users/me?fields=id,email')
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        registration_ip='127.0.0.1', last_ip='127.0.0.1')
+        self.user.set_password('test')
+        self.user.save()
+        self.profile = create_profile(self.user, name='profile')
+
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(0):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEquals(res.status_code, 304)
+        self.assertEquals(res['ETag'], etag)
+        return etag
+
+    def test_user(self):
+        etag = self.assertNotModified('/api/users/me')
+
+        self.user.account_name = 'changed'
+        self.user.save()
+
+        res = self.client.get('/api/users/me', HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(res.status_code, 200)
+        self.assertEquals(res.data['account_name'], 'changed')
+
+    def test_profiles(self):
+        etags = [self.assertNotModified('/api/profiles'), self.assertNotModified('/api/users/me')]
+
+        self.profile.name = 'changed'
+        self.profile.save()
+
+        for url, etag in zip(['/api/profiles', '/api/users/me'], etags):
+            self.assertEquals(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_sparse_fields_have_their_own_etag(self):
+        self.assertNotEquals(self.client.get('/api/users/me')['ETag'],
+                             self.client.get('/api/users/me?fields=id')['ETag'])
+
+    def test_new_ip_bumps_version(self):
+        version = User.objects.get(pk=self.user.pk).version
+
+        buffer = ActivityBuffer(flush_threshold=100, flush_interval=3600, granularity=60)
+        buffer.record(self.user, '127.0.0.1')
+        buffer.flush()
+        self.assertEquals(User.objects.get(pk=self.user.pk).version, version)
+
+        buffer.record(self.user, '10.0.0.1', now=timezone.now() + timedelta(seconds=1))
+        buffer.flush()
+        self.assertEquals(User.objects.get(pk=self.user.pk).version, version + 1)
+
+    def test_new_thumbnails_bump_version(self):
+        self.user.image = 'images/version.png'
+        self.user.save()
+        cache.delete(_get_key('images/version.png'))
+        version = User.objects.get(pk=self.user.pk).version
+
+        update_manifest(self.user.image)  # first build
+        self.assertEquals(User.objects.get(pk=self.user.pk).version, version)
+
+        cache.set(_get_key('images/version.png'), {'100': '/media/images/version.png.100.png'})
+        update_manifest(self.user.image)  # the thumbnail is gone
+        self.assertEquals(User.objects.get(pk=self.user.pk).version, version + 1)
+
+        update_manifest(self.user.image)  # the same URLs
+        self.assertEquals(User.objects.get(pk=self.user.pk).version, version + 1)
+
+    def test_concurrent_saves_get_their_own_version(self):
+        first, second = User.objects.get(pk=self.user.pk), User.objects.get(pk=self.user.pk)
+        first.first_name = 'first'
+        second.last_name = 'second'
+
+        first.save()
+        second.save()
+
+        self.assertEquals(second.version, first.version + 1)
+        self.assertEquals(User.objects.get(pk=self.user.pk).version, second.version)
+        self.assertEquals(get_row_version(self.user.pk), second.version)
+
+    def test_row_version_without_shared_cache(self):
+        version = get_row_version(self.user.pk)
+        User.objects.filter(pk=self.user.pk).update(version=version + 1)  # e.g. another worker
+
+        with override_settings(LOCAL_CACHE_IS_SHARED=False):
+            self.assertEquals(get_row_version(self.user.pk), version + 1)
+
+
+class MedicalProfileBulkTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        registration_ip='127.0.0.1')
+        self.user.set_password('test')
+        self.user.save()
+        self.profile = create_profile(self.user, name='profile')
+
+        self.other = User.objects.create(email='other@example.com', account_name='other')
+        self.other_profile = create_profile(self.other, name='other')
+
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+
+    def post(self, items):
+        return self.client.post('/api/profiles/bulk', json.dumps(items),
+                                content_type='application/json')
+
+    def new_profile(self, **kwargs):
+        data = dict((field.name, False) for field in MedicalProfile._meta.fields
+                    if isinstance(field, models.BooleanField))
+        data['user'] = self.user.pk
+        data.update(kwargs)
+        return data
+
+    def test_create_and_update(self):
+        res = self.post([self.new_profile(name='kid'), {'id': self.profile.pk, 'name': 'me'}])
+
+        self.assertEquals(res.status_code, 200)
+        self.assertEquals([item['name'] for item in res.data], ['kid', 'me'])
+        self.assertEquals(set(self.user.profiles.values_list('name', flat=True)),
+                          set(['kid', 'me']))
+
+    def test_errors_write_nothing(self):
+        res = self.post([self.new_profile(name='kid'), {'id': self.profile.pk, 'age': 'x'}])
+
+        self.assertEquals(res.status_code, 400)
+        self.assertEquals(res.data[0], {})
+        self.assertIn('age', res.data[1])
+        self.assertIn('errors_display', res.data[1])
+        self.assertEquals(self.user.profiles.count(), 1)
+
+    def test_only_own_profiles(self):
+        res = self.post([{'id': self.other_profile.pk, 'name': 'mine'},
+                         self.new_profile(user=self.other.pk)])
+
+        self.assertEquals(res.status_code, 400)
+        self.assertTrue(all(item['non_field_errors'] for item in res.data))
+        self.assertEquals(MedicalProfile.objects.get(pk=self.other_profile.pk).name, 'other')
+
+    def test_expects_a_list(self):
+        self.assertEquals(self.post({'name': 'kid'}).status_code, 400)
+
+    def test_invalid_ids(self):
+        res = self.post([{'id': 'x', 'name': 'a'}, {'id': [1], 'name': 'b'},
+                         {'id': 10 ** 30, 'name': 'c'}, {'id': str(self.profile.pk), 'name': 'me'}])
+
+        self.assertEquals(res.status_code, 400)
+        self.assertEquals([item.get('non_field_errors') for item in res.data],
+                          [['No such profile.']] * 3 + [None])
+
+
+class BatchTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        registration_ip='127.0.0.1')
+        self.user.set_password('test')
+        self.user.save()
+        create_profile(self.user, name='profile')
+
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+        self.client.get('/api/users/me')
+
+    def post(self, items):
+        return self.client.post('/api/batch', json.dumps(items), content_type='application/json')
+
+    def test_batch(self):
+        with self.assertNumQueries(3):  # the user + profiles, and the profiles list
+            res = self.post([{'url': '/api/'}, {'url': '/api/users/me'},
+                             {'url': '/api/profiles?fields=name'}])
+
+        self.assertEquals(res.status_code, 200)
+        self.assertEquals([item['status'] for item in res.data], [200, 200, 200])
+        self.assertEquals(res.data[1]['body']['email'], 'test@example.com')
+        self.assertEquals(res.data[2]['body'], [{'name': 'profile'}])
+        self.assertIn('ETag', res.data[1]['headers'])
+
+    def test_write_and_conditional_requests(self):
+        etag = self.post([{'url': '/api/users/me'}]).data[0]['headers']['ETag']
+
+        res = self.post([
+            {'url': '/api/users/me', 'headers': {'If-None-Match': etag}},
+            {'method': 'PATCH', 'url': '/api/users/me', 'body': {'account_name': 'changed'}},
+        ])
+        self.assertEquals([item['status'] for item in res.data], [304, 200])
+        self.assertEquals(User.objects.get(pk=self.user.pk).account_name, 'changed')
+
+    def test_logout_and_login_items(self):
+        res = self.post([{'url': '/api/users/me'}, {'method': 'POST', 'url': '/api/logout'},
+                         {'url': '/api/users/me'}])
+        self.assertEquals([item['status'] for item in res.data], [200, 200, 403])
+
+        res = self.post([{'method': 'POST', 'url': '/api/login',
+                          'body': {'email': 'test@example.com', 'password': 'test'}},
+                         {'url': '/api/users/me'}])
+        self.assertEquals([item['status'] for item in res.data], [200, 200])
+        self.assertEquals(res.data[1]['body']['email'], 'test@example.com')
+
+        # The session of the batch response is the logged in one
+        self.assertEquals(self.client.get('/api/users/me').status_code, 200)
+
+    def test_not_found(self):
+        res = self.post([{'url': '/api/nothing'}, {'url': '/api/batch'}, {'url': '/admin/'}, {}])
+        self.assertEquals([item['status'] for item in res.data], [404, 404, 404, 400])
+
+        self.assertEquals(self.post({'url': '/api/'}).status_code, 400)
+
+    def test_invalid_items(self):
+        self.user.is_staff = True
+        self.user.save()
+
+        res = self.post([{'url': '/api/users/me', 'headers': ['If-None-Match']},
+                         {'url': '/api/users/me', 'headers': {'If-None-Match': {}}},
+                         {'url': '/api/export/users.csv'}])
+
+        self.assertEquals(res.status_code, 200)
+        self.assertEquals([item['status'] for item in res.data], [400, 400, 400])
+        self.assertEquals(res.data[2]['body']['detail'], "This request can't be batched.")
+
+
+class MessagePackTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        registration_ip='127.0.0.1')
+        self.user.set_password('test')
+        self.user.save()
+        create_profile(self.user, name='profile', birthday=timezone.now())
+
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+
+    def test_render(self):
+        for url in ('/api/users/me', '/api/profiles'):
+            res = self.client.get(url, HTTP_ACCEPT='application/x-msgpack')
+            self.assertEquals(res['Content-Type'], 'application/x-msgpack')
+
+            # Same values as the JSON output, dates included
+            data = msgpack.unpackb(res.content, encoding='utf-8')
+            self.assertEquals(data, json.loads(self.client.get(url).content))
+
+    def test_parse(self):
+        res = self.client.patch('/api/users/me', msgpack.packb({'account_name': u'\xe9t\xe9'}),
+                                content_type='application/x-msgpack')
+        self.assertEquals(res.status_code, 200)
+        self.assertEquals(User.objects.get(pk=self.user.pk).account_name, u'\xe9t\xe9')
+
+        res = self.client.patch('/api/users/me', '\xc1', content_type='application/x-msgpack')
+        self.assertEquals(res.status_code, 400)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    """Refuses the recipients on `refused.example.com`, breaks on `broken.example.com`"""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(to.endswith('@refused.example.com') for to in message.to):
+                raise smtplib.SMTPRecipientsRefused(message.to)
+            if any(to.endswith('@broken.example.com') for to in message.to):
+                raise ValueError(message.to)
+            mail.outbox.append(message)
+        return len(messages)
+
+
+class QueuedEmailTestCase(TestCase):
+    def test_registration_only_queues(self):
+        res = self.client.post('/api/users', {'email': 'Test@example.com', 'account_name': 'test'})
+        self.assertEquals(res.status_code, 201)
+        self.assertEquals(len(mail.outbox), 0)
+
+        email = QueuedEmail.objects.get()
+        self.assertEquals(email.recipients, 'test@example.com')
+
+        call_command('send_queued_mail', stdout=StringIO())
+
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertEquals(mail.outbox[0].to, ['test@example.com'])
+        self.assertEquals(mail.outbox[0].alternatives[0][1], 'text/html')
+
+        email = QueuedEmail.objects.get()
+        self.assertEquals(email.status, QueuedEmail.Status.SENT)
+        self.assertEquals(email.body, '')  # the password isn't kept
+
+        self.assertEquals(send_queued_mail(), 0)
+
+    def test_batches(self):
+        for i in range(5):
+            queue_mail('subject', 'body', 'from@example.com', ['to%d@example.com' % i])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEquals(send_queued_mail(batch_size=2), 5)
+
+        # Claim (select + update) and the results update per batch, then the empty claim
+        queries = [query for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEquals(len(queries), 3 * 3 + 1)
+        self.assertEquals(len(mail.outbox), 5)
+
+    @override_settings(EMAIL_BACKEND='profiles.tests.FailingEmailBackend',
+                       MAIL_RETRY_DELAY=10, MAIL_MAX_ATTEMPTS=3)
+    def test_retries(self):
+        failing = queue_mail('subject', 'body', 'from@example.com', ['to@refused.example.com'])
+        queue_mail('subject', 'body', 'from@example.com', ['to@example.com'])
+
+        self.assertEquals(send_queued_mail(), 1)
+        self.assertEquals(len(mail.outbox), 1)
+
+        failing = QueuedEmail.objects.get(pk=failing.pk)
+        self.assertEquals(failing.status, QueuedEmail.Status.QUEUED)
+        self.assertEquals(failing.attempts, 1)
+        self.assertIn('SMTPRecipientsRefused', failing.last_error)
+        self.assertGreater(failing.next_attempt, timezone.now() + timedelta(seconds=5))
+
+        self.assertEquals(send_queued_mail(), 0)  # not due yet
+
+        self.assertEquals(get_retry_delay(2), 20)
+        for attempt in range(2):
+            QueuedEmail.objects.filter(pk=failing.pk).update(next_attempt=timezone.now())
+            send_queued_mail()
+
+        failing = QueuedEmail.objects.get(pk=failing.pk)
+        self.assertEquals(failing.status, QueuedEmail.Status.FAILED)
+        self.assertEquals(failing.attempts, 3)
+        self.assertEquals(failing.body, '')
+
+    @override_settings(EMAIL_BACKEND='profiles.tests.FailingEmailBackend')
+    def test_unexpected_errors_dont_stop_the_batch(self):
+        broken = queue_mail('subject', 'body', 'from@example.com', ['to@broken.example.com'])
+        queue_mail('subject', 'body', 'from@example.com', ['to@example.com'])
+
+        self.assertEquals(send_queued_mail(), 1)
+
+        broken = QueuedEmail.objects.get(pk=broken.pk)
+        self.assertEquals(broken.attempts, 1)
+        self.assertIn('ValueError', broken.last_error)
+
+
+class PasswordResetTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test')
+
+    def test_issue(self):
+        res = self.client.post('/api/password_reset', {'email': 'test@example.com'})
+        self.assertEquals(res.status_code, 200)
+        first = PasswordResetRequest.objects.get(user=self.user).hash
+
+        with self.assertNumQueries(1):
+            second = PasswordResetRequest.objects.issue(self.user)
+
+        self.assertNotEquals(first, second)
+        self.assertEquals(PasswordResetRequest.objects.get(user=self.user).hash, second)
+
+    def test_complete(self):
+        hash_ = PasswordResetRequest.objects.issue(self.user)
+
+        with override_settings(PASSWORD_RESET_TTL=0):
+            res = self.client.post('/api/password_reset_complete', {'hash': hash_, 'password': 'changed'})
+            self.assertEquals(res.status_code, 400)
+
+        res = self.client.post('/api/password_reset_complete', {'hash': hash_, 'password': 'changed'})
+        self.assertEquals(res.status_code, 200)
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('changed'))
+        self.assertFalse(PasswordResetRequest.objects.exists())
+
+    def test_purge(self):
+        for i in range(5):
+            user = User.objects.create(email='test%d@example.com' % i)
+            PasswordResetRequest.objects.issue(user)
+
+        expired = ['test1@example.com', 'test3@example.com']
+        PasswordResetRequest.objects.filter(user__email__in=expired).update(
+            created=timezone.now() - timedelta(days=2))
+
+        call_command('purge_password_resets', chunk_size=1, stdout=StringIO())
+
+        self.assertEquals(sorted(PasswordResetRequest.objects.values_list('user__email', flat=True)),
+                          ['test0@example.com', 'test2@example.com', 'test4@example.com'])
+
+
+class PasswordRehashTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test')
+        self.user.set_password('test')
+        self.user.save()
+        hasher_stats.reset()
+
+    def get_iterations(self):
+        return User.objects.get(pk=self.user.pk).password.split('$')[1]
+
+    @override_settings(PASSWORD_HASHER_ITERATIONS=1000, PASSWORD_REHASH_ASYNC=False)
+    def test_rehash_on_login(self):
+        self.assertEquals(self.get_iterations(), '12000')
+
+        res = self.client.post('/api/login', {'email': 'test@example.com', 'password': 'wrong'})
+        self.assertEquals(res.status_code, 400)
+        self.assertEquals(self.get_iterations(), '12000')
+
+        res = self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+        self.assertEquals(res.status_code, 200)
+        self.assertEquals(self.get_iterations(), '1000')
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('test'))
+
+        self.assertEquals(hasher_stats.get('checks'), 3)
+        self.assertEquals(hasher_stats.get('rehashes'), 1)
+
+    @override_settings(PASSWORD_HASHER_ITERATIONS=1000, PASSWORD_REHASH_ASYNC=False)
+    def test_rehash_invalidates_the_cached_user(self):
+        self.assertTrue(get_cached_user(self.user.pk).check_password('test'))
+        self.assertEquals(get_cached_user(self.user.pk).password.split('$')[1], '1000')
+
+    def test_calibrate_hashers_command(self):
+        out = StringIO()
+        call_command('calibrate_hashers', samples=1, stdout=out)
+        self.assertIn('TunablePBKDF2PasswordHasher', out.getvalue())
+
+
+class ImportUsersTestCase(TestCase):
+    def setUp(self):
+        User.objects.create(email='Existing@example.com', account_name='existing')  # mixed case
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_csv(self):
+        path = self.write('users.csv', (
+            'email,password,account_name,profile_name,profile_smoker,profile_age\n'
+            ' New@Example.com,secret,new,me,true,43\n'
+            'EXISTING@example.com,,existing,,,\n'
+            'invalid,,invalid,,,\n'
+            'invalid@example.com,,invalid,,,old\n'
+            'extra@example.com,,extra,,,,extra\n'
+            'other@example.com,,other,,,\n'))
+
+        call_command('import_users', path, batch_size=2, processes=1, stdout=StringIO(),
+                     stderr=StringIO())
+
+        user = User.objects.get(email='new@example.com')
+        self.assertTrue(user.check_password('secret'))
+        self.assertFalse(User.objects.get(email='other@example.com').has_usable_password())
+        self.assertEquals(User.objects.count(), 3)
+
+        profile = user.profiles.get()
+        self.assertEquals((profile.name, profile.smoker, profile.age, profile.male),
+                          ('me', True, 43, False))
+
+        with open(path + '.state') as f:
+            self.assertEquals(f.read(), '6')
+
+    def test_jsonl_resume(self):
+        path = self.write('users.jsonl', '\n'.join(json.dumps(record) for record in [
+            {'email': 'first@example.com', 'account_name': 'first'},
+            {'email': 'second@example.com', 'account_name': 'second',
+             'profiles': [{'name': 'one'}, {'name': 'two', 'melanin': 2}]},
+        ]))
+        self.write('users.jsonl.state', '1')
+
+        call_command('import_users', path, resume=True, processes=1, stdout=StringIO())
+
+        self.assertFalse(User.objects.filter(email='first@example.com').exists())
+        user = User.objects.get(email='second@example.com')
+        self.assertEquals(sorted(user.profiles.values_list('name', flat=True)), ['one', 'two'])
+
+    def test_jsonl_invalid_lines(self):
+        path = self.write('users.jsonl', '[1]\n"text"\n{invalid\n{"email": "new@example.com"}\n')
+        out = StringIO()
+
+        call_command('import_users', path, processes=1, stdout=out, stderr=StringIO())
+
+        self.assertTrue(User.objects.filter(email='new@example.com').exists())
+        self.assertIn('3 invalid', out.getvalue())
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name=u't\xe9st',
+                                        is_staff=True, timezone='Asia/Jerusalem')
+        self.user.set_password('test')
+        self.user.save()
+        User.objects.create(email='other@example.com', account_name='other')
+        create_profile(self.user, name='profile', birthday=timezone.now())
+
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+
+    def get(self, url):
+        res = self.client.get(url)
+        self.assertEquals(res.status_code, 200)
+        return ''.join(res.streaming_content)
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.get('/api/export/users.csv'))))
+
+        self.assertEquals(rows[0][:3], ['id', 'email', 'account_name'])
+        self.assertNotIn('password', rows[0])
+        self.assertEquals([row[1] for row in rows[1:]], ['test@example.com', 'other@example.com'])
+        self.assertEquals(rows[1][2].decode('utf-8'), u't\xe9st')
+        self.assertEquals(rows[1][rows[0].index('timezone')], 'Asia/Jerusalem')
+
+    def test_jsonl_gzip(self):
+        content = gzip.GzipFile(fileobj=StringIO(self.get('/api/export/profiles.jsonl.gz'))).read()
+        profiles = [json.loads(line) for line in content.splitlines()]
+
+        self.assertEquals(len(profiles), 1)
+        self.assertEquals(profiles[0]['name'], 'profile')
+        self.assertEquals(profiles[0]['user_id'], self.user.pk)
+
+    def test_staff_only(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        self.client.post('/api/logout')
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+
+        self.assertEquals(self.client.get('/api/export/users.csv').status_code, 403)
+
+    def test_command(self):
+        output = tempfile.NamedTemporaryFile()
+        call_command('export_data', 'users', format='jsonl', chunk_size=1, output=output.name)
+
+        users = [json.loads(line) for line in output.read().splitlines()]
+        self.assertEquals([user['email'] for user in users], ['test@example.com', 'other@example.com'])
+        self.assertEquals(users[0]['timezone'], 'Asia/Jerusalem')
+
+
+class BitFieldTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test')
+        self.smoker = create_profile(self.user, name='smoker', smoker=True)
+        self.both = create_profile(self.user, name='both', smoker=True, vegetarian=True)
+        self.none = create_profile(self.user, name='none')
+
+    def names(self, queryset):
+        return sorted(queryset.values_list('name', flat=True))
+
+    def test_packed_on_save(self):
+        field = MedicalProfile._meta.get_field('flags')
+        flags = MedicalProfile.objects.get(pk=self.both.pk).flags
+
+        self.assertEquals(field.unpack(flags), set(['smoker', 'vegetarian']))
+
+        self.none.male = True
+        self.none.save()
+        self.assertEquals(MedicalProfile.objects.get(pk=self.none.pk).flags, field.get_mask(['male']))
+
+    def test_filters(self):
+        profiles = MedicalProfile.objects
+
+        self.assertEquals(self.names(profiles.all_of('smoker', 'vegetarian')), ['both'])
+        self.assertEquals(self.names(profiles.any_of('smoker', 'vegetarian')), ['both', 'smoker'])
+        self.assertEquals(self.names(profiles.none_of('vegetarian')), ['none', 'smoker'])
+        self.assertEquals(self.names(profiles.filter(user=self.user).all_of('smoker')),
+                          ['both', 'smoker'])
+
+        self.assertRaises(ValueError, profiles.all_of, 'unknown')
+
+    def test_packed_on_partial_save(self):
+        self.none.smoker = True
+        self.none.save(update_fields=['smoker'])
+
+        self.assertEquals(self.names(MedicalProfile.objects.all_of('smoker')),
+                          ['both', 'none', 'smoker'])
+
+    def test_packed_on_update(self):
+        MedicalProfile.objects.filter(pk__in=[self.smoker.pk, self.none.pk]).update(
+            smoker=False, vegetarian=True)
+
+        profiles = MedicalProfile.objects
+        self.assertEquals(self.names(profiles.all_of('vegetarian')), ['both', 'none', 'smoker'])
+        self.assertEquals(self.names(profiles.all_of('smoker')), ['both'])
+        self.assertRaises(ValueError, profiles.update, smoker=models.F('male'))
+
+
+class ProfileStatisticsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        is_staff=True, registration_ip='127.0.0.1')
+        self.user.set_password('test')
+        self.user.save()
+
+        self.profile = create_profile(self.user, name='one', age=43, smoker=True)
+        create_profile(self.user, name='two', melanin=2, smoker=True, vegetarian=True)
+
+    def test_deltas(self):
+        self.assertEquals(get_statistics(), {
+            'total': 2,
+            'age': {'43': 1, 'none': 1},
+            'melanin': {'2': 1, 'none': 1},
+            'flag': {'smoker': 2, 'vegetarian': 1},
+        })
+
+        profile = MedicalProfile.objects.get(pk=self.profile.pk)
+        profile.age = 60
+        profile.smoker = False
+        profile.save()
+
+        statistics = get_statistics()
+        self.assertEquals(statistics['age'], {'60': 1, 'none': 1})
+        self.assertEquals(statistics['flag'], {'smoker': 1, 'vegetarian': 1})
+
+        profile.delete()
+
+        statistics = get_statistics()
+        self.assertEquals(statistics['total'], 1)
+        self.assertEquals(statistics['age'], {'none': 1})
+
+    def test_endpoint(self):
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+
+        self.client.get('/api/profiles/statistics')  # caches the user
+
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/profiles/statistics')
+
+        self.assertEquals(res.status_code, 200)
+        self.assertEquals(res.data['total'], 2)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=False)
+        self.client.post('/api/logout')
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+
+        self.assertEquals(self.client.get('/api/profiles/statistics').status_code, 403)
+
+    def test_rebuild(self):
+        expected = get_statistics()
+
+        ProfileStatistic.objects.filter(dimension='flag', value='smoker').update(count=5)
+        ProfileStatistic.objects.filter(dimension='age', value='43').delete()
+
+        out = StringIO()
+        call_command('rebuild_profile_statistics', chunk_size=1, stdout=out)
+
+        self.assertIn('2 differences', out.getvalue())
+        self.assertIn('not written', out.getvalue())
+        self.assertNotEquals(get_statistics(), expected)  # only reported by default
+
+        call_command('rebuild_profile_statistics', chunk_size=1, write=True, stdout=StringIO())
+        self.assertEquals(get_statistics(), expected)
+
+
+class SparseFieldsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        registration_ip='127.0.0.1')
+        self.user.set_password('test')
+        self.user.save()
+        create_profile(self.user, name='profile')
+
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+        self.client.get('/api/users/me')
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get('/api/users/me?fields=id,account_name')
+
+        self.assertEquals(set(res.data), set(['id', 'account_name']))
+
+        # Only the user, narrowed to the requested columns
+        self.assertEquals(len(queries), 1)
+        self.assertNotIn('"email"', queries[0]['sql'])
+
+    def test_list_fields_dont_load_unselected_images(self):
+        for i in range(4):
+            User.objects.create(email='test%d@example.com' % i, account_name='test%d' % i,
+                                image='images/test%d.png' % i)
+        self.user.is_staff = True  # lists all the users
+        self.user.save()
+        self.client.get('/api/users/me')  # caches the user again
+
+        for query in ('fields=id,email', 'exclude=image,image_crop_100,image_crop_mini'):
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get('/api/users?page_size=5&' + query)
+
+            self.assertEquals(res.status_code, 200)
+            self.assertEquals(len(res.data), 5)
+            self.assertNotIn('image', res.data[0])
+            self.assertEquals(len(queries), 1)  # no query per user for the deferred image
+
+    def test_nested_fields(self):
+        res = self.client.get('/api/users/me?fields=id,profiles.name')
+
+        self.assertEquals(set(res.data), set(['id', 'profiles']))
+        self.assertEquals(res.data['profiles'], [{'name': 'profile'}])
+
+    def test_exclude(self):
+        res = self.client.get('/api/users/me?exclude=image,profiles.medicines_text')
+
+        self.assertNotIn('image', res.data)
+        self.assertIn('image_crop_100', res.data)
+        self.assertIn('name', res.data['profiles'][0])
+        self.assertNotIn('medicines_text', res.data['profiles'][0])
+
+
+class UserCacheTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        registration_ip='127.0.0.1')
+        self.user.set_password('test')
+        self.user.save()
+
+    def test_cached_user(self):
+        with self.assertNumQueries(1):
+            get_cached_user(self.user.pk)
+
+        with self.assertNumQueries(0):
+            user = get_cached_user(self.user.pk)
+
+        self.assertEquals(user, self.user)
+        self.assertEquals(get_cached_user(0), None)
+
+    def test_invalidated_on_save(self):
+        get_cached_user(self.user.pk)
+
+        self.user.set_password('other')
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            user = get_cached_user(self.user.pk)
+        self.assertTrue(user.check_password('other'))
+
+    def test_invalidated_on_activity_flush(self):
+        get_cached_user(self.user.pk)
+
+        buffer = ActivityBuffer(flush_threshold=1, flush_interval=3600, granularity=60)
+        buffer.record(self.user, '10.0.0.2')
+
+        self.assertEquals(get_cached_user(self.user.pk).last_ip, '10.0.0.2')
+
+    @override_settings(LOCAL_CACHE_IS_SHARED=False)
+    def test_per_process_cache_isnt_used(self):
+        get_cached_user(self.user.pk)
+
+        with self.assertNumQueries(1):
+            get_cached_user(self.user.pk)
+
+    def test_session_requests_dont_query_the_user(self):
+        self.client.post('/api/login', {'email': 'test@example.com', 'password': 'test'})
+        self.client.get('/api/users/me')
+
+        # Only the serialized user and its profiles - no session or auth queries
+        with self.assertNumQueries(2):
+            res = self.client.get('/api/users/me')
+
+        self.assertEquals(res.status_code, 200)
+
+
+class SignedTokenTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.com', account_name='test',
+                                        registration_ip='127.0.0.1')
+        self.user.set_password('test')
+        self.user.save()
+
+    def get_tokens(self):
+        res = self.client.post('/api/token', {'email': 'test@example.com', 'password': 'test'})
+        self.assertEquals(res.status_code, 200)
+        return res.data
+
+    def test_parse_token(self):
+        token = make_token(self.user, ACCESS, now=1000)
+        claims = parse_token(token, ACCESS, now=1001)
+
+        self.assertEquals(claims['user_id'], self.user.pk)
+        self.assertEquals(claims['version'], self.user.token_version)
+
+        self.assertRaises(InvalidToken, parse_token, token, REFRESH, now=1001)
+        self.assertRaises(InvalidToken, parse_token, token, ACCESS, now=1000 + 10 ** 6)
+        self.assertRaises(InvalidToken, parse_token, token.replace('.0.', '.1.', 1), ACCESS,
+                          now=1001)
+
+    def test_authenticate_without_queries(self):
+        access_token = self.get_tokens()['access_token']
+
+        with self.assertNumQueries(0):
+            res = self.client.get('/api/token/revoke',
+                                  HTTP_AUTHORIZATION='Token ' + access_token)
+        self.assertEquals(res.status_code, 405)  # authenticated, POST only
+
+        res = self.client.get('/api/users/me', HTTP_AUTHORIZATION='Token ' + access_token)
+        self.assertEquals(res.status_code, 200)
+        self.assertEquals(res.data['email'], 'test@example.com')
+
+    def test_invalid_token(self):
+        res = self.client.get('/api/users/me', HTTP_AUTHORIZATION='Token invalid')
+        self.assertEquals(res.status_code, 403)  # session auth comes first, no 401s
+
+    def test_refresh_and_revoke(self):
+        tokens = self.get_tokens()
+
+        res = self.client.post('/api/token/refresh', {'refresh_token': tokens['refresh_token']})
+        self.assertEquals(res.status_code, 200)
+
+        res = self.client.post('/api/token/revoke',
+                               HTTP_AUTHORIZATION='Token ' + res.data['access_token'])
+        self.assertEquals(res.status_code, 200)
+
+        res = self.client.post('/api/token/refresh', {'refresh_token': tokens['refresh_token']})
+        self.assertEquals(res.status_code, 400)
+
+    def test_revoke_invalidates_the_cached_user(self):
+        access_token = self.get_tokens()['access_token']
+        get_cached_user(self.user.pk)
+
+        res = self.client.post('/api/token/revoke', HTTP_AUTHORIZATION='Token ' + access_token)
+        self.assertEquals(res.status_code, 200)
+
+        self.assertEquals(get_cached_user(self.user.pk).token_version,
+                          self.user.token_version + 1)
+
+
+class CompiledSerializerTestCase(TestCase):
+    def test_same_output(self):
+        user = User.objects.create(email='test@example.com', account_name='test',
+                                   registration_ip='127.0.0.1')
+        create_profile(user, name='profile', age=MedicalProfile.Age.ADULT,
+                       birthday=timezone.now())
+
+        request = RequestFactory().get('/api/users/me')
+        request.user = user
+        context = {'request': request, 'view': None}
+
+        class UncompiledUserSerializer(UserSerializer):
+            class Meta(UserSerializer.Meta):
+                compiled = False
+
+        compiled = UserSerializer(user, context=context).data
+        self.assertEquals(compiled, UncompiledUserSerializer(user, context=context).data)
+        self.assertEquals(compiled['profiles'][0]['adult'], True)
+        self.assertEquals(list(compiled), list(UserSerializer.Meta.fields))
+
+        # The browsable API's forms use the field metadata
+        self.assertEquals(compiled.fields['email']._value, 'test@example.com')
+
+    def test_plans_are_bounded(self):
+        user = User.objects.create(email='test@example.com', account_name='test',
+                                   registration_ip='127.0.0.1')
+
+        class LimitedUserSerializer(UserSerializer):
+            max_compiled_plans = 2
+
+        for fields in ('id', 'email', 'id,email', 'account_name', 'id,account_name'):
+            request = RequestFactory().get('/api/users/me', {'fields': fields})
+            data = LimitedUserSerializer(user, context={'request': request}).data
+            self.assertEquals(list(data), fields.split(','))
+
+        self.assertEquals(len(LimitedUserSerializer._compiled_plans), 2)
+
 
 class UserSerializerTestCase(TestCase):
     def test_serializer_validate_password_ok(self):
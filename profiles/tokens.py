@@ -0,0 +1,132 @@
+"""
+Stateless, HMAC signed access and refresh tokens.
+
+A token is "<kind>.<user id>.<token version>.<expiry>.<flags>.<signature>".
+Access tokens are verified without any database or cache access, so they
+are short lived. Refresh tokens are checked against the user's current
+token_version, bumping it (User.revoke_tokens()) revokes all of them.
+"""
+
+import hashlib
+import hmac
+import time
+from base64 import urlsafe_b64encode
+
+from django.conf import settings
+from django.db.models.query_utils import deferred_class_factory
+from django.utils.crypto import constant_time_compare
+
+from .models import User
+
+ACCESS = 'a'
+REFRESH = 'r'
+
+FLAG_STAFF = 1
+FLAG_SUPERUSER = 2
+
+# Loaded from the token, all the other User fields are deferred
+TOKEN_FIELDS = ('id', 'is_staff', 'is_superuser')
+
+_key_cache = {}
+_token_user_class = []
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _get_key():
+    secret = settings.SECRET_KEY
+    if secret not in _key_cache:
+        _key_cache[secret] = hashlib.sha256(b'profiles.tokens' + secret.encode('utf-8')).digest()
+    return _key_cache[secret]
+
+
+def _sign(payload):
+    digest = hmac.new(_get_key(), payload, hashlib.sha256).digest()
+    return urlsafe_b64encode(digest).rstrip(b'=')
+
+
+def get_ttl(kind):
+    if kind == ACCESS:
+        return getattr(settings, 'ACCESS_TOKEN_TTL', 5 * 60)
+    return getattr(settings, 'REFRESH_TOKEN_TTL', 60 * 60 * 24 * 30)
+
+
+def make_token(user, kind=ACCESS, now=None):
+    now = now if now is not None else time.time()
+
+    flags = ((FLAG_STAFF if user.is_staff else 0) |
+             (FLAG_SUPERUSER if user.is_superuser else 0))
+    payload = '%s.%d.%d.%d.%d' % (kind, user.pk, user.token_version,
+                                  int(now) + get_ttl(kind), flags)
+
+    return '%s.%s' % (payload, _sign(payload))
+
+
+def parse_token(token, kind=ACCESS, now=None):
+    """
+    Verifies the token, returns a dict with its user_id, version, expires and
+    flags. Raises InvalidToken for bad signatures, other kinds and expired tokens.
+    """
+    try:
+        token = str(token)
+    except UnicodeEncodeError:
+        raise InvalidToken('Malformed token')
+
+    payload, _, signature = token.rpartition('.')
+
+    if not constant_time_compare(_sign(payload), signature):
+        raise InvalidToken('Bad signature')
+
+    try:
+        token_kind, user_id, version, expires, flags = payload.split('.')
+        claims = {
+            'user_id': int(user_id),
+            'version': int(version),
+            'expires': int(expires),
+            'flags': int(flags),
+        }
+    except ValueError:
+        raise InvalidToken('Malformed token')
+
+    if token_kind != kind:
+        raise InvalidToken('Wrong token kind')
+
+    if claims['expires'] <= (now if now is not None else time.time()):
+        raise InvalidToken('Token expired')
+
+    return claims
+
+
+def _get_token_user_class():
+    if not _token_user_class:
+        deferred = [field.attname for field in User._meta.concrete_fields
+                    if field.attname not in TOKEN_FIELDS]
+        _token_user_class.append(deferred_class_factory(User, deferred))
+    return _token_user_class[0]
+
+
+def get_token_user(claims):
+    """
+    A User instance built from the token claims only. Any other field is
+    loaded from the database when it's first accessed.
+    """
+    user = _get_token_user_class()(
+        id=claims['user_id'],
+        is_staff=bool(claims['flags'] & FLAG_STAFF),
+        is_superuser=bool(claims['flags'] & FLAG_SUPERUSER),
+    )
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def issue_tokens(user):
+    """The response body for a successful token login / refresh"""
+    return {
+        'access_token': make_token(user, ACCESS),
+        'refresh_token': make_token(user, REFRESH),
+        'token_type': 'Token',
+        'expires_in': get_ttl(ACCESS),
+    }
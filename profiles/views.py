@@ -1,20 +1,30 @@
 from django.conf import settings
 from django.contrib.auth import login, logout
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.views.generic import TemplateView
 from django.utils.translation import ugettext_lazy as _
-from django.core.mail import EmailMultiAlternatives
 
 from rest_framework import generics, status
-from rest_framework.permissions import AllowAny, IsAuthenticated, BasePermission, SAFE_METHODS
+from rest_framework.permissions import (AllowAny, IsAdminUser, IsAuthenticated, BasePermission,
+                                        SAFE_METHODS)
 from rest_framework.response import Response
 
-from common.viewsets import NoDeleteModelViewSet
+from common.pagination import CursorPaginationMixin
+from common.throttling import EmailRateThrottle, IPRateThrottle, ThrottleFailuresMixin
+from common.viewsets import (ConditionalGetMixin, NoDeleteModelViewSet, PrefetchRelatedMixin,
+                             SparseFieldsQuerysetMixin, ThumbnailManifestMixin)
 
 from .serializers import (UserSerializer, AuthenticationSerializer,
                           PasswordResetSerializer,
                           PasswordResetCompleteSerializer,
-                          MedicalProfileSerializer)
+                          MedicalProfileSerializer, TokenRefreshSerializer)
+from .cache import get_row_version
+from .export import CONTENT_TYPES, export
+from .mail import queue_mail
 from .models import User, PasswordResetRequest, MedicalProfile
+from .statistics import get_statistics
+from .tokens import issue_tokens
 
 
 class CustomUserPermissions(BasePermission):
@@ -59,13 +69,22 @@ class CustomUserPermissions(BasePermission):
 
 # class MedicalProfileView
 
-class MedicalProfileViewSet(NoDeleteModelViewSet):
+class MedicalProfileViewSet(ConditionalGetMixin, CursorPaginationMixin, SparseFieldsQuerysetMixin,
+                            NoDeleteModelViewSet):
     """
     /users/me/profiles or  users/:userid/profiles
     """
     model = MedicalProfile
     serializer_class = MedicalProfileSerializer
     permission_classes = (IsAuthenticated, )
+    cursor_ordering = ('modified', 'id')
+
+    def get_etag_version(self, request, *args, **kwargs):
+        """A regular user lists his own profiles, their changes bump User.version"""
+        user = request.user
+
+        if self.action == 'list' and not user.is_staff and not user.is_superuser:
+            return get_row_version(user.pk)
 
     # def get_object(self):
     #     """
@@ -98,10 +117,133 @@ class MedicalProfileViewSet(NoDeleteModelViewSet):
         return queryset.filter(user=self.request.user.pk)
 
 
-class UserViewSet(NoDeleteModelViewSet):
+class MedicalProfileBulkView(generics.GenericAPIView):
+    """
+    Create and partially update several profiles in one request.
+
+    Expects a list of profiles, the ones with an "id" are updated. All of them
+    are validated first and written in one transaction - or none of them if
+    any is invalid. Responds with the list of saved profiles, or with the list
+    of each profile's errors ({} for the valid ones).
+
+    Regular users can only manage their own profiles.
+    """
+    model = MedicalProfile
+    serializer_class = MedicalProfileSerializer
+    permission_classes = (IsAuthenticated, )
+    max_id = 2 ** 31 - 1  # INT primary key
+
+    def error(self, message):
+        """Errors in the FormatErrorsSerializer format"""
+        return {'non_field_errors': [message], 'errors_display': [message]}
+
+    def parse_id(self, value):
+        """The profile id `value` as an int, None if it can't be a primary key"""
+        if isinstance(value, bool) or not isinstance(value, (int, long, basestring)):
+            return None
+
+        try:
+            pk = int(value)
+        except ValueError:
+            return None
+
+        return pk if 0 < pk <= self.max_id else None
+
+    def post(self, request):
+        items = request.DATA
+        max_items = getattr(settings, 'BULK_MAX_ITEMS', 100)
+
+        if not isinstance(items, list) or not items:
+            return Response(self.error(_('Expected a list of profiles.')),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if len(items) > max_items:
+            return Response(self.error(_('At most {count} profiles per request.')
+                                       .format(count=max_items)),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        is_staff = user.is_staff or user.is_superuser
+
+        queryset = MedicalProfile.objects.all() if is_staff else \
+            MedicalProfile.objects.filter(user=user.pk)
+        ids = [self.parse_id(item['id']) for item in items
+               if isinstance(item, dict) and item.get('id')]
+        ids = [pk for pk in ids if pk is not None]
+        instances = queryset.in_bulk(ids) if ids else {}
+
+        serializers, errors = [], []
+
+        for item in items:
+            if not isinstance(item, dict):
+                serializers.append(None)
+                errors.append(self.error(_('Expected a profile.')))
+                continue
+
+            instance = None
+            if item.get('id'):
+                instance = instances.get(self.parse_id(item['id']))
+                if instance is None:
+                    serializers.append(None)
+                    errors.append(self.error(_('No such profile.')))
+                    continue
+
+            serializer = self.get_serializer(instance, data=item, partial=instance is not None)
+
+            if not serializer.is_valid():
+                error = serializer.errors
+            elif not is_staff and serializer.object.user_id != user.pk:
+                error = self.error(_('You can only manage your own profiles.'))
+            else:
+                error = {}
+
+            serializers.append(serializer)
+            errors.append(error)
+
+        if any(errors):
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            for serializer in serializers:
+                serializer.save(force_insert=serializer.object.pk is None)
+
+        return Response([serializer.data for serializer in serializers])
+
+    put = patch = post
+
+
+class ProfileStatisticsView(generics.GenericAPIView):
+    """
+    Number of profiles in total, by age, by melanin and per health flag.
+    Staff only. Read from the incrementally maintained summary table
+    (profiles.statistics).
+    """
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request):
+        return Response(get_statistics())
+
+
+class UserViewSet(ConditionalGetMixin, CursorPaginationMixin, SparseFieldsQuerysetMixin,
+                  PrefetchRelatedMixin, ThumbnailManifestMixin, NoDeleteModelViewSet):
     model = User
     serializer_class = UserSerializer
     permission_classes = (CustomUserPermissions, )
+    thumbnail_fields = ('image', )
+    prefetch_related = ('profiles', )
+
+    def get_etag_version(self, request, *args, **kwargs):
+        """Only for the user himself (/users/me), other users' objects need permission checks"""
+        lookup = self.kwargs.get(self.lookup_field)
+
+        if self.action == 'retrieve' and lookup in ('me', str(request.user.pk)):
+            return get_row_version(request.user.pk)
+
+    def get_prefetch_related(self):
+        if self.action == 'list':
+            return []  # UserSerializer shows the profiles to the user himself only
+
+        return super(UserViewSet, self).get_prefetch_related()
 
     def get_object(self):
         """
@@ -135,14 +277,13 @@ class UserViewSet(NoDeleteModelViewSet):
 
     def post_save(self, obj, created):
         """
-        Save registration ip and log the user in, email password via SendGrid
+        Save registration ip and log the user in, queue the password email
         """
         super(UserViewSet, self).post_save(obj, created)
         user = obj
 
         if created and obj.registration_ip:
-            user.set_country_by_ip()
-            user.set_timezone_by_country()
+            user.set_timezone_by_country(user.set_country_by_ip())
             password = User.objects.make_random_password()
             user.set_password(password)
             user.save()
@@ -190,10 +331,8 @@ class UserViewSet(NoDeleteModelViewSet):
                             "<br><br>"
                             "The Vita Personal Team"
                             "<div>").format(p=password, e=obj.email)
-            msg = EmailMultiAlternatives(subject, text_content, from_email,
-                                         email_list)
-            msg.attach_alternative(html_content, "text/html")
-            msg.send()
+            queue_mail(subject, text_content, from_email, email_list,
+                       html_body=html_content)
         # login the user on creation
         if not self.request.user.is_authenticated() and created:
             # hack to set the auth backend to log the user in:
@@ -209,9 +348,11 @@ class UserRolePermission(BasePermission):
         return False
 
 
-class LoginView(generics.GenericAPIView):
+class LoginView(ThrottleFailuresMixin, generics.GenericAPIView):
     permission_classes = (AllowAny, )
     serializer_class = AuthenticationSerializer
+    throttle_classes = (IPRateThrottle, EmailRateThrottle)
+    throttle_scope = 'login'
 
     def post(self, request):
 
@@ -243,17 +384,48 @@ class LogoutView(generics.GenericAPIView):
     post = logout
 
 
+class TokenView(ThrottleFailuresMixin, generics.GenericAPIView):
+    """Issue an access token and a refresh token, see profiles.tokens"""
+    permission_classes = (AllowAny, )
+    serializer_class = AuthenticationSerializer
+    throttle_classes = (IPRateThrottle, EmailRateThrottle)
+    throttle_scope = 'login'
+
+    def post(self, request):
+        serializer = self.serializer_class(data=request.DATA)
+
+        if serializer.is_valid():
+            return Response(issue_tokens(serializer.user))
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TokenRefreshView(TokenView):
+    serializer_class = TokenRefreshSerializer
+    throttle_classes = ()  # no password to guess
+
+
+class TokenRevokeView(generics.GenericAPIView):
+    """Revoke all the refresh tokens issued for the current user"""
+    permission_classes = (IsAuthenticated, )
+
+    def post(self, request):
+        request.user.revoke_tokens()
+        return Response({'result': _('Tokens revoked')})
+
+
 class PasswordResetView(generics.GenericAPIView):
     permission_classes = (AllowAny, )
     serializer_class = PasswordResetSerializer
+    throttle_classes = (IPRateThrottle, EmailRateThrottle)
+    throttle_scope = 'password_reset'
 
     def post(self, request):
         serializer = self.serializer_class(data=request.DATA, context={'request': request})
 
         if serializer.is_valid():
             user = serializer._user  # cached user
-            PasswordResetRequest.objects.filter(user=user).delete()  # delete previous entries
-            PasswordResetRequest.objects.create(user=user)
+            PasswordResetRequest.objects.issue(user)  # replaces the previous hash
 
             return Response({'result': _('Please check your E-mail')})
 
@@ -274,8 +446,9 @@ class PasswordResetCompleteView(generics.GenericAPIView):
             user = serializer._user  # cached user
             PasswordResetRequest.objects.filter(user=user).delete()  # delete previous entries
 
-            # change the password
+            # change the password, revoking the issued tokens
             user.set_password(serializer.data['password'])
+            user.token_version += 1
             user.save()
 
             # Log the user in
@@ -287,7 +460,23 @@ class PasswordResetCompleteView(generics.GenericAPIView):
         return Response(data=serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ExportView(generics.GenericAPIView):
+    """
+    Streams all the users or medical profiles as CSV or JSON lines, gzipped
+    with the ".gz" suffix (e.g. /api/export/profiles.jsonl.gz). Staff only.
+    """
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request, name, fmt, gz=None):
+        content_type = 'application/gzip' if gz else CONTENT_TYPES[fmt]
+        response = StreamingHttpResponse(export(name, fmt, gzip=bool(gz)), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="{}.{}{}"'.format(
+            name, fmt, gz or '')
+        return response
+
+
 class SocialAuthView(TemplateView):
     """Temporary view for testing"""
     pass
     # raise Exception("Not implemented")
+
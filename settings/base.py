@@ -70,7 +70,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'profiles.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -94,6 +94,8 @@ ROOT_URLCONF = 'vita_auth.urls'
 WSGI_APPLICATION = 'vita_auth.wsgi.application'
 
 GEOIP_PATH = os.path.join(PROJECT_ROOT, 'GeoIP.dat')
+GEOIP_CACHE_SIZE = 10000  # ip -> country lookups kept in memory per process
+GEOIP_CHECK_INTERVAL = 60  # seconds between checks for an updated GeoIP.dat
 
 # Database
 # https://docs.djangoproject.com/en/1.6/ref/settings/#databases
@@ -113,13 +115,76 @@ AUTH_USER_MODEL = 'profiles.User'
 
 MIN_PASSWORD_LENGTH = 4
 
+# The first hasher hashes new passwords, the others verify existing hashes.
+# Hashes with another algorithm or cost are updated on login (common.hashers)
+PASSWORD_HASHERS = (
+    'common.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.BCryptPasswordHasher',
+    'django.contrib.auth.hashers.SHA1PasswordHasher',
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+    'django.contrib.auth.hashers.UnsaltedSHA1PasswordHasher',
+    'django.contrib.auth.hashers.UnsaltedMD5PasswordHasher',
+    'django.contrib.auth.hashers.CryptPasswordHasher',
+)
+PASSWORD_HASHER_ITERATIONS = 12000  # PBKDF2 cost, see the calibrate_hashers command
+# Rehash outdated hashes in a thread after the login. uWSGI runs no threads
+# without --enable-threads: set it to False there (rehashed during the login)
+PASSWORD_REHASH_ASYNC = True
+
 
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 7  # 1 week (in seconds)
 SESSION_SAVE_EVERY_REQUEST = True
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Shared by all the worker processes: sessions, cached users and row versions
+# are invalidated through it (a per-process LocMemCache is refused, see
+# common.utils.is_shared_cache). Point all the app servers at the same memcached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    }
+}
+
+# Database sessions read through the cache, written only on change (common.sessions)
+SESSION_ENGINE = 'common.sessions'
+SESSION_CACHE_ALIAS = 'default'
+SESSION_TOUCH_FRACTION = 0.9  # extend the stored expiry when less than 90% of the age is left
+
+# Compact JSON sessions, still loads (and re-encodes) sessions stored with the PickleSerializer
+SESSION_SERIALIZER = 'common.sessions.CompactSerializer'
+
+# Keyset pagination of the list endpoints (common.pagination)
+CURSOR_PAGE_SIZE = 100
+CURSOR_MAX_PAGE_SIZE = 1000
+
+BULK_MAX_ITEMS = 100  # profiles per /api/profiles/bulk request
+BATCH_MAX_REQUESTS = 20  # requests per /api/batch request
 
-SESSION_SERIALIZER = 'django.contrib.sessions.serializers.PickleSerializer'
+USER_CACHE_TIMEOUT = 60 * 60  # seconds, cached user objects (profiles.cache)
+
+# Cached thumbnail alias -> URL manifests (common.thumbnails)
+THUMBNAIL_MANIFEST_TIMEOUT = None  # never expire, a changed image gets a new manifest
+THUMBNAIL_MANIFEST_INCOMPLETE_TIMEOUT = 5 * 60  # seconds, while thumbnails are missing
+
+PASSWORD_RESET_TTL = 24 * 60 * 60  # seconds, password reset hashes expire after that
+
+# Signed tokens (profiles.tokens), access tokens can't be revoked before they expire
+ACCESS_TOKEN_TTL = 5 * 60  # seconds
+REFRESH_TOKEN_TTL = 60 * 60 * 24 * 30  # seconds
+
+# Email outbox (profiles.mail), sent by the send_queued_mail command
+MAIL_BATCH_SIZE = 100  # messages per batch
+MAIL_SEND_TIMEOUT = 5 * 60  # seconds, a claimed batch is sent again after that
+MAIL_RETRY_DELAY = 60  # seconds after the first failure, doubled after every next one
+MAIL_MAX_RETRY_DELAY = 60 * 60  # seconds
+MAIL_MAX_ATTEMPTS = 8  # then the message is marked as failed
+
+# Write-behind buffer for User.last_activity / last_ip (profiles.activity)
+ACTIVITY_FLUSH_INTERVAL = 30  # seconds between flushes
+ACTIVITY_FLUSH_THRESHOLD = 500  # flush once that many users are pending
+ACTIVITY_GRANULARITY = 60  # seconds, activity closer than that isn't recorded
 
 
 LANGUAGE_CODE = 'en-us'
@@ -236,10 +301,31 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         # 'rest_framework.authentication.OAuth2Authentication',#mobile clients
         'authentication.SessionAuthenticationNoCSRF',
+        'authentication.SignedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # MessagePack for clients sending "Accept: application/x-msgpack" (or ?format=msgpack)
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'common.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'common.parsers.MessagePackParser',
+    ),
+    # Sliding window limits of the views' throttle_scope, per IP / per submitted email
+    # (common.throttling)
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_email': '10/min',
+        'password_reset_ip': '20/hour',
+        'password_reset_email': '5/hour',
+    },
     'DEFAULT_FILTER_BACKENDS': ('rest_framework.filters.DjangoFilterBackend',
                                 'rest_framework.filters.OrderingFilter')
 }
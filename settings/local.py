@@ -7,6 +7,14 @@ DATABASES = {
     }
 }
 
+# runserver (and the tests) run in a single process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+LOCAL_CACHE_IS_SHARED = True
+
 EMAIL_HOST = 'smtp.sendgrid.net'
 EMAIL_HOST_USER = 'hellgy'
 EMAIL_HOST_PASSWORD = '123q123q'
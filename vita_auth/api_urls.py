@@ -1,10 +1,12 @@
 from django.conf.urls import patterns, url, include
 from rest_framework import routers
-from common.views import APIRootView
+from common.views import APIRootView, BatchView
 from profiles.views import (UserViewSet, LoginView, LogoutView,
                             PasswordResetView,
                             PasswordResetCompleteView,
-                            MedicalProfileViewSet)
+                            MedicalProfileViewSet, MedicalProfileBulkView, TokenView,
+                            TokenRefreshView, TokenRevokeView, ExportView,
+                            ProfileStatisticsView)
 
 
 class CustomRouter(routers.SimpleRouter):
@@ -22,11 +24,20 @@ router.register(r'profiles', MedicalProfileViewSet)
 
 
 urlpatterns = patterns(
+    '',
     url(r'^/?$', APIRootView.as_view(), name="root"),
+    url(r'^batch/?$', BatchView.as_view(), name='batch'),
     url(r'^login/?$', LoginView.as_view(), name='login'),
     url(r'^logout/?$', LogoutView.as_view(), name='logout'),
+    url(r'^token/?$', TokenView.as_view(), name='token'),
+    url(r'^token/refresh/?$', TokenRefreshView.as_view(), name='token_refresh'),
+    url(r'^token/revoke/?$', TokenRevokeView.as_view(), name='token_revoke'),
     url(r'^password_reset/?$', PasswordResetView.as_view()),
     url(r'^password_reset_complete/?$', PasswordResetCompleteView.as_view()),
+    url(r'^profiles/bulk/?$', MedicalProfileBulkView.as_view(), name='profiles_bulk'),
+    url(r'^profiles/statistics/?$', ProfileStatisticsView.as_view(), name='profiles_statistics'),
+    url(r'^export/(?P<name>users|profiles)\.(?P<fmt>csv|jsonl)(?P<gz>\.gz)?$', ExportView.as_view(),
+        name='export'),
     # url(r'^check_version', CheckVersionView.as_view()),
 
     url(r'^', include(router.urls)),
@@ -27,6 +27,12 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings.staging")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Open the GeoIP database now: when the server imports this module in its
+# master process (uWSGI/gunicorn without lazy apps) the workers inherit
+# the mapping instead of each opening it.
+from common.geoip import geoip_resolver
+geoip_resolver.preload()
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)